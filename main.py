@@ -1,17 +1,72 @@
+from src.conf import startup_profile
+startup_profile.install()  # no-op unless STARTUP_PROFILE is set
+
 import asyncio
+import logging
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, BackgroundTasks
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, BackgroundTasks, Request, status
+from fastapi.responses import JSONResponse
+from src.conf import log
+from src.database.db import sessionmanager, redis_client
 from src.routes import auth, contacts
+from src.services import avatar, email, events, singleflight
+from src.services.auth import auth_service
+from src.services.compression import CompressionMiddleware
+from src.services.idempotency import IdempotencyMiddleware
+from src.services.static import CachedStaticFiles
+from src.services.tracking import tracker
 from starlette.middleware.cors import CORSMiddleware
 import uvicorn
-app = FastAPI()
+
+startup_profile.mark("imports")
+
+log.setup()
+
+
+async def redis_ping() -> bool:
+    try:
+        return await redis_client.ping()
+    except Exception:
+        return False
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: pay for connections, bcrypt backend and templates before the first request does
+    app.state.ready = False
+    log.start()
+    auth_service.warm_up()
+    email.warm_up()
+    try:
+        await sessionmanager.warm_up()
+    except Exception as err:
+        logging.error(f"Database warm up failed: {err}")
+    app.state.ready = await sessionmanager.ping() and await redis_ping()
+    await events.broker.start()
+    await tracker.start()
+    yield
+    # Shutdown: uvicorn has already stopped accepting connections and drained
+    # in-flight requests (and their background tasks) before we get here.
+    app.state.ready = False
+    await events.broker.stop()
+    await tracker.stop()
+    await avatar.close()
+    await redis_client.close()
+    await sessionmanager.close()
+    log.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth.router)
 app.include_router(contacts.router, prefix='/api')
 
-app.mount("/static", StaticFiles(directory="src/static"), name="static")
+app.mount("/static", CachedStaticFiles(), name="static")
 
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(log.RequestIdMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -22,7 +77,7 @@ app.add_middleware(
 
 async def tack():
     await asyncio.sleep(3)
-    print("Send email")
+    logging.info("Send email")
     return True
 
 @app.get("/")
@@ -31,5 +86,25 @@ async def read_root(background_task: BackgroundTasks):
     return {"message": "CONTACTS"}
 
 
+@app.get("/healthchecker")
+async def healthchecker(request: Request):
+    database = await sessionmanager.ping()
+    cache = await redis_ping()
+    ready = request.app.state.ready and database and cache
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"ready": ready, "database": database, "redis": cache},
+    )
+
+
+@app.get("/metrics/singleflight")
+async def singleflight_metrics():
+    return singleflight.stats()
+
+
+startup_profile.mark("app construction")
+startup_profile.report()
+
+
 if __name__ =='__main__':
-    uvicorn.run("main:app", host="localhost", reload=True, log_level="info")
\ No newline at end of file
+    uvicorn.run("main:app", host="localhost", reload=True, log_level="info", timeout_graceful_shutdown=30)
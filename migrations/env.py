@@ -1,15 +1,18 @@
 import asyncio
+import io
 from logging.config import fileConfig
 
-from sqlalchemy import pool
+from sqlalchemy import pool, text
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from alembic import context
+from alembic.runtime.migration import MigrationContext
 
 
 from src.conf.config import config as app_config
 from src.database.models import Base
+from migrations.helpers import lock_report
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -88,7 +91,53 @@ def run_migrations_online() -> None:
     asyncio.run(run_async_migrations())
 
 
+def review_mode() -> bool:
+    return context.get_x_argument(as_dictionary=True).get("review", "").lower() in ("1", "true", "yes")
+
+
+def inspect_database(connection: Connection):
+    current = MigrationContext.configure(connection).get_current_revision()
+    rows = connection.execute(text(
+        "SELECT relname, reltuples::bigint FROM pg_class "
+        "WHERE relkind IN ('r', 'p') AND relnamespace = 'public'::regnamespace"
+    )).all()
+    return current, {name: count for name, count in rows}
+
+
+async def run_migrations_review() -> None:
+    """Review mode: ``alembic -x review=true upgrade head``.
+
+    Renders the pending migrations as SQL without executing them and prints the
+    lock each statement takes together with the estimated rows of its table.
+
+    """
+    connectable = async_engine_from_config(
+        config.get_section(config.config_ini_section, {}),
+        prefix="sqlalchemy.",
+        poolclass=pool.NullPool,
+    )
+    async with connectable.connect() as connection:
+        current, table_rows = await connection.run_sync(inspect_database)
+    await connectable.dispose()
+
+    buffer = io.StringIO()
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        as_sql=True,
+        output_buffer=buffer,
+        starting_rev=current,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+    print(lock_report(buffer.getvalue(), table_rows))
+
+
 if context.is_offline_mode():
     run_migrations_offline()
+elif review_mode():
+    asyncio.run(run_migrations_review())
 else:
     run_migrations_online()
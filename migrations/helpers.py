@@ -0,0 +1,102 @@
+"""
+Helpers for migrations that touch large tables.
+
+- create_index_concurrently / drop_index_concurrently run outside the migration
+  transaction, so writes to the table continue while the index is built.
+- backfill walks a table in primary key order and commits every batch on its own,
+  sleeping between batches, so row locks and WAL bursts stay small.
+- lock_report is used by ``alembic -x review=true upgrade head`` (see env.py) to list
+  the lock each statement takes and how many rows sit behind it, without executing anything.
+
+Add new columns as nullable without a default and backfill them; on these tables
+``op.add_column`` with a volatile default rewrites the whole table under an ACCESS EXCLUSIVE lock.
+"""
+import re
+import time
+
+import sqlalchemy as sa
+from alembic import op
+
+BATCH_SIZE = 5000
+PAUSE = 0.05  # seconds between batches
+
+
+def reviewing() -> bool:
+    return op.get_context().as_sql
+
+
+def create_index_concurrently(index_name: str, table_name: str, columns: list[str], **kw) -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(index_name, table_name, columns, postgresql_concurrently=True, **kw)
+
+
+def drop_index_concurrently(index_name: str, table_name: str) -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(index_name, table_name=table_name, postgresql_concurrently=True)
+
+
+def backfill(table_name: str, columns: list[str], update_sql: str, compute=None,
+             batch_size: int = BATCH_SIZE, pause: float = PAUSE) -> None:
+    """
+    Run ``update_sql`` for every row of ``table_name``, ``batch_size`` rows per commit.
+    ``compute(row)`` turns a row with ``id`` and ``columns`` into the statement parameters,
+    by default just ``{"id": row.id}``.
+    """
+    if reviewing():
+        # escaped, the offline compiler would otherwise look for values of the bind parameters
+        op.execute(f"-- backfill in batches of {batch_size}\n{update_sql}".replace(":", "\\:"))
+        return
+    compute = compute or (lambda row: {"id": row.id})
+    select_sql = sa.text(
+        f"SELECT {', '.join(['id', *columns])} FROM {table_name} "
+        f"WHERE id > :last_id ORDER BY id LIMIT :limit"
+    )
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        last_id = 0
+        while True:
+            rows = connection.execute(select_sql, {"last_id": last_id, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            connection.execute(sa.text(update_sql), [compute(row) for row in rows])
+            last_id = rows[-1].id
+            time.sleep(pause)
+
+
+# first match wins, so the CONCURRENTLY forms come before the plain ones
+LOCKS = [
+    (re.compile(r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY .*? ON (\w+)", re.S | re.I),
+     "SHARE UPDATE EXCLUSIVE", "reads and writes continue"),
+    (re.compile(r"CREATE (?:UNIQUE )?INDEX .*? ON (\w+)", re.S | re.I),
+     "SHARE", "writes blocked for the whole index build"),
+    (re.compile(r"DROP INDEX CONCURRENTLY", re.I), "SHARE UPDATE EXCLUSIVE", "reads and writes continue"),
+    (re.compile(r"DROP INDEX", re.I), "ACCESS EXCLUSIVE", "short, but queues behind running queries"),
+    (re.compile(r"ALTER TABLE (\w+) ADD COLUMN .* DEFAULT .*\(", re.S | re.I),
+     "ACCESS EXCLUSIVE", "volatile default, the table is rewritten"),
+    (re.compile(r"ALTER TABLE (\w+)", re.I), "ACCESS EXCLUSIVE", "short, but queues behind running queries"),
+    (re.compile(r"UPDATE (\w+)", re.I), "ROW EXCLUSIVE", "row locks, writes only"),
+    (re.compile(r"CREATE TRIGGER \w+ .*? ON (\w+)", re.S | re.I), "SHARE ROW EXCLUSIVE", "writes blocked, short"),
+    (re.compile(r"CREATE TABLE (\w+)", re.I), "ACCESS EXCLUSIVE", "new table"),
+]
+
+
+def lock_report(sql: str, table_rows: dict[str, int]) -> str:
+    """One line per statement of ``sql``: lock mode, table and the estimated rows behind it."""
+    lines = []
+    for statement in sql.split(";"):
+        body = "\n".join(line for line in statement.splitlines() if line.strip()
+                         and not line.lstrip().startswith("-- Running")).strip()
+        if not body or body.upper().startswith(("BEGIN", "COMMIT", "INSERT INTO ALEMBIC_VERSION",
+                                                "UPDATE ALEMBIC_VERSION", "CREATE TABLE ALEMBIC_VERSION")):
+            continue
+        for pattern, lock, impact in LOCKS:
+            match = pattern.search(body)
+            if match:
+                table = match.group(1) if match.groups() else "?"
+                rows = table_rows.get(table)
+                estimate = f"~{rows} rows" if rows is not None else "rows unknown"
+                lines.append(f"{lock:<23} {table:<12} {estimate:<16} {impact}\n    {body.splitlines()[-1][:120]}")
+                break
+        else:
+            lines.append(f"{'?':<23} {'?':<12} {'':<16} review by hand\n    {body.splitlines()[-1][:120]}")
+    return "\n".join(lines) or "nothing to apply"
@@ -0,0 +1,98 @@
+"""contact duplicate keys
+
+Revision ID: 37961a1bd3ec
+Revises: 12b8041f84f7
+Create Date: 2026-10-19 10:12:41.518203
+
+"""
+from alembic import op
+import re
+
+import sqlalchemy as sa
+
+from migrations.helpers import backfill, create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = '37961a1bd3ec'
+down_revision = '12b8041f84f7'
+branch_labels = None
+depends_on = None
+
+
+# Frozen copies of src/services/normalize.py as of this revision. The live module keeps
+# changing (5d2e8c41f0b7 switched phones to E.164), and this revision must keep
+# writing the same values.
+_NON_DIGITS = re.compile(r"\D")
+
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ye", "ж": "zh",
+    "з": "z", "и": "y", "і": "i", "ї": "yi", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n",
+    "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ь": "", "ю": "yu", "я": "ya", "ё": "e", "ы": "y",
+    "э": "e", "ъ": "", "'": "", "’": "",
+}
+
+_SOUNDEX = {letter: digit for digit, letters in {
+    "1": "bfpv", "2": "cgjkqsxz", "3": "dt", "4": "l", "5": "mn", "6": "r"}.items() for letter in letters}
+
+
+def normalize_email(email):
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+
+def normalize_phone(phone):
+    if not phone:
+        return None
+    return _NON_DIGITS.sub("", phone) or None
+
+
+def soundex(word):
+    letters = [char for char in "".join(_TRANSLIT.get(char, char) for char in word.lower()) if "a" <= char <= "z"]
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    last = _SOUNDEX.get(letters[0], "")
+    for char in letters[1:]:
+        digit = _SOUNDEX.get(char, "")
+        if digit and digit != last:
+            code += digit
+        if char not in "hw":
+            last = digit
+    return (code + "000")[:4]
+
+
+def name_key(first_name, last_name):
+    words = f"{first_name or ''} {last_name or ''}".split()
+    codes = sorted(code for code in (soundex(word) for word in words) if code)
+    return " ".join(codes) or None
+
+
+def keys(row) -> dict:
+    return {"id": row.id,
+            "email": normalize_email(row.email),
+            "phone": normalize_phone(row.phone),
+            "name_key": name_key(row.first_name, row.last_name)}
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('email_normalized', sa.String(), nullable=True))
+    op.add_column('contacts', sa.Column('phone_normalized', sa.String(), nullable=True))
+    op.add_column('contacts', sa.Column('name_key', sa.String(), nullable=True))
+    backfill('contacts', ['first_name', 'last_name', 'email', 'phone'],
+             "UPDATE contacts SET email_normalized = :email, phone_normalized = :phone, name_key = :name_key "
+             "WHERE id = :id", keys)
+    create_index_concurrently('ix_contacts_user_id_email_normalized', 'contacts', ['user_id', 'email_normalized'])
+    create_index_concurrently('ix_contacts_user_id_phone_normalized', 'contacts', ['user_id', 'phone_normalized'])
+    create_index_concurrently('ix_contacts_user_id_name_key', 'contacts', ['user_id', 'name_key'])
+
+
+def downgrade() -> None:
+    drop_index_concurrently('ix_contacts_user_id_name_key', 'contacts')
+    drop_index_concurrently('ix_contacts_user_id_phone_normalized', 'contacts')
+    drop_index_concurrently('ix_contacts_user_id_email_normalized', 'contacts')
+    op.drop_column('contacts', 'name_key')
+    op.drop_column('contacts', 'phone_normalized')
+    op.drop_column('contacts', 'email_normalized')
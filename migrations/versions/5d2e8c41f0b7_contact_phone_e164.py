@@ -0,0 +1,70 @@
+"""contact phone e164
+
+Revision ID: 5d2e8c41f0b7
+Revises: 37961a1bd3ec
+Create Date: 2026-10-19 11:40:03.274915
+
+"""
+from alembic import op
+import re
+
+import sqlalchemy as sa
+
+from migrations.helpers import backfill
+from src.conf.config import config
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e8c41f0b7'
+down_revision = '37961a1bd3ec'
+branch_labels = None
+depends_on = None
+
+UPDATE_PHONE = "UPDATE contacts SET phone_normalized = :phone WHERE id = :id"
+
+
+# Frozen copy of src/services/normalize.normalize_phone as of this revision, so that
+# later changes to the live function don't change what this revision writes.
+_NON_DIGITS = re.compile(r"\D")
+MIN_NATIONAL_DIGITS = 7
+
+
+def normalize_phone(phone):
+    if not phone:
+        return None
+    country_code = config.default_country_code
+    phone = phone.strip()
+    digits = _NON_DIGITS.sub("", phone)
+    if phone.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    else:
+        if country_code == "380" and digits.startswith("80") and len(digits) == 11:
+            digits = digits[1:]
+        if digits.startswith("0"):
+            national = digits[1:]
+        elif digits.startswith(country_code):
+            national = digits[len(country_code):]
+        else:
+            national = digits
+        if len(national) < MIN_NATIONAL_DIGITS:
+            return None
+        digits = country_code + national
+    if not 8 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+def digits_only(phone):
+    digits = "".join(char for char in phone or "" if char.isdigit())
+    return digits or None
+
+
+def upgrade() -> None:
+    # phone_normalized switches from digits only to E.164, the (user_id, phone_normalized) index stays
+    backfill('contacts', ['phone'], UPDATE_PHONE, lambda row: {"id": row.id, "phone": normalize_phone(row.phone)})
+
+
+def downgrade() -> None:
+    backfill('contacts', ['phone'], UPDATE_PHONE, lambda row: {"id": row.id, "phone": digits_only(row.phone)})
@@ -0,0 +1,38 @@
+"""contact change feed
+
+Revision ID: 9a41c7e25d63
+Revises: 5d2e8c41f0b7
+Create Date: 2026-10-19 13:05:27.640118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill, create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = '9a41c7e25d63'
+down_revision = '5d2e8c41f0b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE contacts_change_seq")
+    op.add_column('contacts', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('contacts', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    # nullable without a default, so adding it does not rewrite the table
+    op.add_column('contacts', sa.Column('change_seq', sa.BigInteger(), nullable=True))
+    # default first, so rows inserted while the backfill runs are numbered too
+    op.alter_column('contacts', 'change_seq', server_default=sa.text("nextval('contacts_change_seq')"))
+    backfill('contacts', [], "UPDATE contacts SET change_seq = nextval('contacts_change_seq') WHERE id = :id")
+    create_index_concurrently('ix_contacts_user_id_change_seq', 'contacts', ['user_id', 'change_seq'])
+
+
+def downgrade() -> None:
+    drop_index_concurrently('ix_contacts_user_id_change_seq', 'contacts')
+    op.drop_column('contacts', 'change_seq')
+    op.drop_column('contacts', 'deleted_at')
+    op.drop_column('contacts', 'updated_at')
+    op.execute("DROP SEQUENCE contacts_change_seq")
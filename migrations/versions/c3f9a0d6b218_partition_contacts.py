@@ -0,0 +1,159 @@
+"""partition contacts
+
+Optional: hash-partitions ``contacts`` by ``user_id`` when run with
+``alembic -x contacts_partitions=16 upgrade head``; without the argument this
+revision changes nothing. To partition later, downgrade past it and upgrade again
+with the argument.
+
+Rows are copied in batches while the app keeps running. Rows changed meanwhile
+are found through a temporary change_seq index (above a watermark read once
+in-flight writes have committed), rows deleted meanwhile through a trigger that
+logs their ids, and both are applied again during a short catch-up under an
+EXCLUSIVE lock, which blocks writes but not reads. The foreign key is in place
+before the copy, so the swap only renames. The old table is kept as
+``contacts_unpartitioned`` until it is dropped by hand.
+
+A partitioned table's primary key and unique indexes must include the partition
+key, so the primary key becomes (id, user_id) and email is unique per user.
+user_id must be set on every contact.
+
+Revision ID: c3f9a0d6b218
+Revises: 9a41c7e25d63
+Create Date: 2026-10-19 15:22:10.930561
+
+"""
+import time
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from migrations.helpers import create_index_concurrently, reviewing
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f9a0d6b218'
+down_revision = '9a41c7e25d63'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 20000
+PAUSE = 0.05
+
+INDEXES = {
+    'ix_contacts_id': '(id)',
+    'ix_contacts_first_name': '(first_name)',
+    'ix_contacts_last_name': '(last_name)',
+    'ix_contacts_user_id_email_normalized': '(user_id, email_normalized)',
+    'ix_contacts_user_id_phone_normalized': '(user_id, phone_normalized)',
+    'ix_contacts_user_id_name_key': '(user_id, name_key)',
+    'ix_contacts_user_id_change_seq': '(user_id, change_seq)',
+}
+
+
+def partitions() -> int:
+    return int(context.get_x_argument(as_dictionary=True).get('contacts_partitions', 0))
+
+
+def is_partitioned(connection) -> bool:
+    return connection.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'contacts'::regclass)"
+    )).scalar()
+
+
+def execute(sql: str, **params):
+    if reviewing():
+        # nothing runs in review mode; escaped, so the offline compiler keeps the parameter names
+        op.execute(sql.replace(":", "\\:"))
+        return None
+    return op.get_bind().execute(sa.text(sql), params)
+
+
+def copy_changed(source: str, target: str, deleted: str, since: int | None) -> None:
+    # both lookups go through indexes, the catch-up touches only what changed during the copy
+    execute(f"DELETE FROM {target} WHERE id IN (SELECT id FROM {source} WHERE change_seq > :since)", since=since)
+    execute(f"INSERT INTO {target} SELECT * FROM {source} WHERE change_seq > :since", since=since)
+    execute(f"DELETE FROM {target} WHERE id IN (SELECT id FROM {deleted})")
+
+
+def upgrade() -> None:
+    count = partitions()
+    if not count:
+        return
+    if not reviewing() and execute("SELECT EXISTS (SELECT 1 FROM contacts WHERE user_id IS NULL)").scalar():
+        raise RuntimeError("contacts without user_id can't be hash partitioned, assign or delete them first")
+
+    op.execute("CREATE TABLE contacts_partitioned (LIKE contacts INCLUDING DEFAULTS) PARTITION BY HASH (user_id)")
+    op.execute("ALTER TABLE contacts_partitioned ALTER COLUMN user_id SET NOT NULL")
+    for remainder in range(count):
+        op.execute(f"CREATE TABLE contacts_p{remainder} PARTITION OF contacts_partitioned "
+                   f"FOR VALUES WITH (MODULUS {count}, REMAINDER {remainder})")
+    # checked row by row during the copy, instead of over the whole table under the swap's lock
+    op.execute("ALTER TABLE contacts_partitioned ADD CONSTRAINT contacts_partitioned_user_id_fkey "
+               "FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE")
+    # temporary, for the catch-up: changed rows by change_seq, deleted rows from a log
+    create_index_concurrently('ix_contacts_catchup_change_seq', 'contacts', ['change_seq'])
+    op.execute("CREATE TABLE contacts_deleted (id integer NOT NULL)")
+    op.execute("CREATE FUNCTION contacts_log_delete() RETURNS trigger LANGUAGE plpgsql AS "
+               "$$ BEGIN INSERT INTO contacts_deleted VALUES (OLD.id); RETURN NULL; END $$")
+    op.execute("CREATE TRIGGER contacts_log_delete AFTER DELETE ON contacts "
+               "FOR EACH ROW EXECUTE FUNCTION contacts_log_delete()")
+    # change_seq is drawn at flush and becomes visible at commit, so a value read while writers
+    # are in flight could be above a change that commits later. SHARE waits for those writers
+    # (they hold ROW EXCLUSIVE from before their draw) and holds off new ones until the copy
+    # below commits this transaction, so every change_seq up to since is settled.
+    op.execute("LOCK TABLE contacts IN SHARE MODE")
+    copy_batch = ("WITH batch AS (INSERT INTO contacts_partitioned "
+                  "SELECT * FROM contacts WHERE id > :last_id ORDER BY id LIMIT :limit RETURNING id) "
+                  "SELECT max(id) FROM batch")
+    if reviewing():
+        since = None
+        op.execute(f"-- copy in batches of {BATCH_SIZE}, each committed on its own\n" + copy_batch.replace(":", "\\:"))
+    else:
+        since = execute("SELECT coalesce(max(change_seq), 0) FROM contacts").scalar()
+        with op.get_context().autocommit_block():
+            last_id = 0
+            while True:
+                last = execute(copy_batch, last_id=last_id, limit=BATCH_SIZE).scalar()
+                if last is None:
+                    break
+                last_id = last
+                time.sleep(PAUSE)
+
+    # indexes after the bulk copy, they are built once per partition instead of row by row
+    op.execute("ALTER TABLE contacts_partitioned ADD CONSTRAINT contacts_partitioned_pkey PRIMARY KEY (id, user_id)")
+    op.execute("CREATE UNIQUE INDEX ix_contacts_p_user_id_email ON contacts_partitioned (user_id, email)")
+    for name, columns in INDEXES.items():
+        op.execute(f"CREATE INDEX {name}_p ON contacts_partitioned {columns}")
+    op.execute("CREATE INDEX ix_contacts_catchup_change_seq_p ON contacts_partitioned (change_seq)")
+
+    op.execute("LOCK TABLE contacts IN EXCLUSIVE MODE")
+    copy_changed('contacts', 'contacts_partitioned', 'contacts_deleted', since)
+    op.execute("DROP TRIGGER contacts_log_delete ON contacts")
+    op.execute("DROP FUNCTION contacts_log_delete()")
+    op.execute("DROP TABLE contacts_deleted")
+    op.execute("DROP INDEX ix_contacts_catchup_change_seq")
+    op.execute("DROP INDEX ix_contacts_catchup_change_seq_p")
+    op.execute("ALTER TABLE contacts RENAME TO contacts_unpartitioned")
+    op.execute("ALTER TABLE contacts_unpartitioned RENAME CONSTRAINT contacts_pkey TO contacts_unpartitioned_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_unpartitioned")
+        op.execute(f"ALTER INDEX {name}_p RENAME TO {name}")
+    op.execute("ALTER TABLE contacts_partitioned RENAME TO contacts")
+    op.execute("ALTER TABLE contacts RENAME CONSTRAINT contacts_partitioned_pkey TO contacts_pkey")
+    op.execute("ALTER TABLE contacts RENAME CONSTRAINT contacts_partitioned_user_id_fkey TO contacts_user_id_fkey")
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY contacts.id")
+
+
+def downgrade() -> None:
+    # in review mode the statements are listed as if contacts were partitioned
+    if not reviewing() and not is_partitioned(op.get_bind()):
+        return
+    op.execute("LOCK TABLE contacts IN EXCLUSIVE MODE")
+    op.execute("TRUNCATE contacts_unpartitioned")
+    op.execute("INSERT INTO contacts_unpartitioned SELECT * FROM contacts")
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY contacts_unpartitioned.id")
+    op.execute("DROP TABLE contacts")
+    op.execute("ALTER TABLE contacts_unpartitioned RENAME TO contacts")
+    op.execute("ALTER TABLE contacts RENAME CONSTRAINT contacts_unpartitioned_pkey TO contacts_pkey")
+    for name in INDEXES:
+        op.execute(f"ALTER INDEX {name}_unpartitioned RENAME TO {name}")
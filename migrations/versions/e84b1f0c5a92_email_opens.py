@@ -0,0 +1,36 @@
+"""email opens
+
+Revision ID: e84b1f0c5a92
+Revises: c3f9a0d6b218
+Create Date: 2026-10-19 17:48:55.102374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e84b1f0c5a92'
+down_revision = 'c3f9a0d6b218'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('email_opens',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('opened_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('email_open_stats',
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('opens', sa.BigInteger(), nullable=False),
+    sa.Column('last_opened_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('username')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('email_open_stats')
+    op.drop_table('email_opens')
@@ -0,0 +1,122 @@
+"""
+Production entry point: ``python server.py``.
+
+Runs ``main:app`` in several worker processes. With gunicorn installed the master
+preloads the app once and binds with SO_REUSEPORT; without it uvicorn's own
+process manager is used, which shares a single listening socket between workers.
+uvloop and httptools are picked up whenever they are installed. Both paths run
+StreamClosingServer, which ends open SSE streams as soon as shutdown begins.
+``python main.py`` stays the single-process development server with reload.
+"""
+import importlib.util
+import os
+import sys
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from src.conf.config import config
+from src.services.events import broker
+
+APP = "main:app"
+
+
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def worker_count() -> int:
+    return config.workers or os.cpu_count() or 1
+
+
+def loop_impl() -> str:
+    return "uvloop" if installed("uvloop") else "asyncio"
+
+
+def http_impl() -> str:
+    return "httptools" if installed("httptools") else "h11"
+
+
+class StreamClosingServer(uvicorn.Server):
+    async def shutdown(self, sockets=None) -> None:
+        # uvicorn waits for every open connection before the lifespan shutdown runs, and
+        # an SSE stream never ends by itself, so each shutdown would wait out the timeout
+        broker.close_streams()
+        await super().shutdown(sockets)
+
+
+if installed("gunicorn"):
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.arbiter import Arbiter
+    from gunicorn.util import import_app
+    from uvicorn.workers import UvicornWorker
+
+    class ProductionWorker(UvicornWorker):
+        CONFIG_KWARGS = {
+            "loop": loop_impl(),
+            "http": http_impl(),
+            "limit_concurrency": config.limit_concurrency,
+        }
+
+        async def _serve(self) -> None:
+            # UvicornWorker._serve, with StreamClosingServer
+            self.config.app = self.wsgi
+            server = StreamClosingServer(config=self.config)
+            self._install_sigquit_handler()
+            await server.serve(sockets=self.sockets)
+            if not server.started:
+                sys.exit(Arbiter.WORKER_BOOT_ERROR)
+
+    class GunicornApplication(BaseApplication):
+        def __init__(self, options: dict):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(APP)
+
+
+def run_gunicorn():
+    GunicornApplication({
+        "bind": f"{config.server_host}:{config.server_port}",
+        "workers": worker_count(),
+        "worker_class": "server.ProductionWorker",
+        "keepalive": config.keep_alive,
+        "backlog": config.backlog,
+        "preload_app": config.preload_app,
+        "reuse_port": config.reuse_port,
+        "graceful_timeout": 30,
+    }).run()
+
+
+def run_uvicorn():
+    # uvicorn.run, with StreamClosingServer
+    server_config = uvicorn.Config(
+        APP,
+        host=config.server_host,
+        port=config.server_port,
+        workers=worker_count(),
+        loop=loop_impl(),
+        http=http_impl(),
+        timeout_keep_alive=config.keep_alive,
+        backlog=config.backlog,
+        limit_concurrency=config.limit_concurrency,
+        timeout_graceful_shutdown=30,
+        access_log=False,
+    )
+    server = StreamClosingServer(server_config)
+    if server_config.workers > 1:
+        Multiprocess(server_config, target=server.run, sockets=[server_config.bind_socket()]).run()
+    else:
+        server.run()
+
+
+if __name__ == '__main__':
+    if installed("gunicorn"):
+        run_gunicorn()
+    else:
+        run_uvicorn()
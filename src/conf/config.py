@@ -13,6 +13,39 @@ class Settings(BaseSettings):
     mail_server: str = "smtp.meta.ua"
     redis_host: str = 'localhost'
     redis_port: int = 6379
+    default_country_code: str = "380"
+    gravatar_base_url: str = "https://www.gravatar.com"
+    gravatar_check: bool = False
+    gravatar_timeout: float = 3.0
+    events_backend: str = "redis"  # or "local" for a single process
+    events_queue_size: int = 100
+    events_keep_alive: float = 15.0
+    idempotency_backend: str = "redis"  # or "local" for a single process
+    idempotency_ttl: int = 60 * 60 * 24
+    idempotency_paths: list[str] = ["/auth/signup", "/api/contacts/create"]
+    static_max_age: int = 60 * 60
+    static_cdn_url: str = ""
+    tracking_buffer_size: int = 100_000
+    tracking_batch_size: int = 1000
+    tracking_flush_interval: float = 2.0
+    compression_min_size: int = 1024
+    password_scheme: str = "bcrypt"  # or "argon2" (needs argon2-cffi)
+    bcrypt_rounds: int = 12
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536  # KiB
+    argon2_parallelism: int = 4
+    log_level: str = "INFO"
+    log_format: str = "json"  # or "text"
+    log_queue_size: int = 10_000
+    log_sample: dict[str, float] = {"email.opens": 0.01}
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    workers: int = 0  # 0 - one worker per CPU
+    keep_alive: int = 5
+    backlog: int = 2048
+    limit_concurrency: int | None = None
+    preload_app: bool = True
+    reuse_port: bool = True
 
     class Config:
         env_file = ".env"
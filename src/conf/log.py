@@ -0,0 +1,217 @@
+"""
+Structured logging.
+
+setup() points the root logger at a QueueHandler: a log call on the event loop only
+copies the record into a bounded in-memory queue, and a QueueListener thread,
+started and stopped in the app lifespan, does the formatting and the blocking
+write to stdout. When the queue is full, records are dropped and counted in
+``handler.dropped`` so that logging never stalls a request.
+
+Each record is emitted as one JSON line. It carries the request id set by
+RequestIdMiddleware, or taken from an incoming ``X-Request-ID`` header.
+Info and debug records from loggers named in ``log_sample`` are kept only at the
+configured rate, e.g. ``{"email.opens": 0.01}``. Passwords, tokens and the
+configured secrets are masked before anything is written.
+"""
+import copy
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import urlsplit
+
+from src.conf.config import config
+
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+REDACTED = "***"
+SECRET_KEYS = re.compile(r"pass(word|wd)?|secret|token|api_key|authorization|cookie", re.IGNORECASE)
+SECRET_PATTERNS = [
+    re.compile(r"(?i)(bearer\s+)[\w\-.~+/]+=*"),
+    re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+"),  # JWT
+    re.compile(r"(://[^:/@\s]+:)[^@\s]+(?=@)"),  # credentials in a URL
+    re.compile(r"(?i)((?:password|passwd|secret|token|api_key)[\"']?\s*[=:]\s*[\"']?)[^\s\"',&]+"),
+]
+# config values masked wherever they show up; matching field names would also hide
+# harmless settings such as password_scheme
+SECRET_FIELDS = ("mail_password", "secret_key", "cloudinary_api_secret")
+# attributes every LogRecord has; anything else came in through extra=
+RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+def config_secrets() -> list[str]:
+    values = [getattr(config, name, None) for name in SECRET_FIELDS]
+    values.append(urlsplit(config.DB_URL).password)
+    return [str(value) for value in values if value and len(str(value)) >= 4]
+
+
+def redact(text: str, secrets: list[str]) -> str:
+    for secret in secrets:
+        text = text.replace(secret, REDACTED)
+    for pattern in SECRET_PATTERNS:
+        text = pattern.sub(lambda m: (m.group(1) if m.groups() else "") + REDACTED, text)
+    return text
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Keeps ``rate`` of the info/debug records of a logger and its children."""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def rate(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class RedactFilter(logging.Filter):
+    def __init__(self, secrets: list[str]):
+        super().__init__()
+        self.secrets = secrets
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.msg = redact(str(record.msg), self.secrets)
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text, self.secrets)
+        for name, value in list(vars(record).items()):
+            if name in RECORD_ATTRS:
+                continue
+            if SECRET_KEYS.search(name):
+                setattr(record, name, REDACTED)
+            elif isinstance(value, str):
+                setattr(record, name, redact(value, self.secrets))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRS:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # only merge the arguments here; formatting happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+handler: NonBlockingQueueHandler | None = None
+listener: QueueListener | None = None
+
+
+def setup() -> None:
+    global handler, listener
+    if handler is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if config.log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    output.addFilter(RedactFilter(config_secrets()))
+
+    handler = NonBlockingQueueHandler(queue.Queue(config.log_queue_size))
+    handler.addFilter(SampleFilter(config.log_sample))
+    handler.addFilter(RequestIdFilter())
+    listener = QueueListener(handler.queue, output, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(config.log_level)
+    # uvicorn installs its own stream handlers; send its records through ours instead
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger = logging.getLogger(name)
+        logger.handlers = []
+        logger.propagate = True
+
+
+def start() -> None:
+    if listener is not None and listener._thread is None:
+        listener.start()
+
+
+def stop() -> None:
+    # drains whatever is still queued before returning
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+
+
+class RequestIdMiddleware:
+    """Gives every request an id, logged with each record and echoed as ``X-Request-ID``."""
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = dict(scope["headers"]).get(self.header, b"").decode("latin-1")
+        if not re.fullmatch(r"[\w\-.]{1,128}", value):
+            value = uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (self.header, value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,100 @@
+"""
+Startup profiler for the API process.
+
+Set ``STARTUP_PROFILE=1`` and main.py reports how long every top-level import took
+and how long it took to build the app. To guard against cold start regressions run::
+
+    python -m src.conf.startup_profile --budget-ms 1500
+
+which imports main.py in a fresh interpreter without the profiler, so the import hook
+and the report are not part of the measurement, and exits with 1 when it is over
+budget. Only then is the import repeated with the profiler on, to show where the time went.
+Only the standard library is used here, so it can be installed before anything else.
+"""
+import argparse
+import builtins
+import os
+import subprocess
+import sys
+import time
+
+ENV_FLAG = "STARTUP_PROFILE"
+
+_original_import = builtins.__import__
+_imports: dict[str, float] = {}
+_marks: list[tuple[str, float]] = []
+_started: float | None = None
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        # cumulative time, children included; keep the outermost measurement
+        _imports.setdefault(name, time.perf_counter() - start)
+
+
+def enabled() -> bool:
+    return os.getenv(ENV_FLAG, "").lower() in ("1", "true", "yes")
+
+
+def install() -> None:
+    global _started
+    if not enabled() or _started is not None:
+        return
+    _started = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+def mark(stage: str) -> None:
+    if _started is not None:
+        _marks.append((stage, time.perf_counter()))
+
+
+def report(top: int = 25) -> None:
+    global _started
+    if _started is None:
+        return
+    builtins.__import__ = _original_import
+    out = sys.stderr
+    print("---- startup profile ----", file=out)
+    previous = _started
+    for stage, at in _marks:
+        print(f"{stage:<40} {(at - previous) * 1000:9.1f} ms", file=out)
+        previous = at
+    print(f"{'total':<40} {(previous - _started) * 1000:9.1f} ms", file=out)
+    print(f"---- slowest imports (top {top}, cumulative) ----", file=out)
+    for name, seconds in sorted(_imports.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{name:<40} {seconds * 1000:9.1f} ms", file=out)
+    _started = None
+
+
+def run_import(module: str, profile: bool) -> float:
+    env = dict(os.environ)
+    env.pop(ENV_FLAG, None)
+    if profile:
+        env[ENV_FLAG] = "1"
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], env=env, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def cold_start_ms(module: str = "main") -> float:
+    return run_import(module, profile=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API cold start against a budget")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", 1500)))
+    parser.add_argument("--module", default="main")
+    args = parser.parse_args()
+
+    elapsed = cold_start_ms(args.module)
+    print(f"cold start: {elapsed:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if elapsed > args.budget_ms:
+        print("cold start is over budget, profiling (times include the profiler's overhead):", file=sys.stderr)
+        run_import(args.module, profile=True)
+        sys.exit(1)
@@ -1,5 +1,9 @@
+import asyncio
 import contextlib
 from typing import AsyncIterator
+
+import redis.asyncio as redis
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine, async_sessionmaker, create_async_engine
 
 from sqlalchemy.orm import DeclarativeBase
@@ -25,16 +29,49 @@ class DatabaseSessionManager:
         session = self._session_maker()
         try:
             yield session
-        except Exception as err:
-            print(err)
+        except Exception:
             await session.rollback()
+            raise
         finally:
             await session.close()
 
+    async def warm_up(self, connections: int = 5) -> None:
+        """Open ``connections`` pooled connections so the first requests don't pay for the handshake."""
+        if self._engine is None:
+            raise Exception("DatabaseSessionManager is not initialized")
+
+        async def _ping():
+            async with self._engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+
+        await asyncio.gather(*(_ping() for _ in range(connections)))
+
+    async def ping(self) -> bool:
+        try:
+            async with self._engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    async def close(self) -> None:
+        if self._engine is None:
+            return
+        await self._engine.dispose()
+        self._engine = None
+        self._session_maker = None
+
+
 sessionmanager = DatabaseSessionManager(config.DB_URL) # noqa
+redis_client = redis.Redis(host=config.redis_host, port=config.redis_port)
 
 # Dependency
 async def get_db():
+    """
+    Unit of work for one request: FastAPI caches this dependency, so every dependency and
+    the route share one session and one transaction. Repository functions only flush;
+    the route commits once at the end, anything that raises is rolled back.
+    """
     async with sessionmanager.session() as session:
         yield session
 
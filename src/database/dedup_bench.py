@@ -0,0 +1,84 @@
+"""
+Duplicate detection on one user with a large address book.
+
+    python -m src.database.dedup_bench --contacts 1000000
+
+Creates a scratch user, gives it generated contacts whose blocking keys overlap the way
+real address books do, and times repository.find_duplicates page by page:
+- about 5% repeat another contact's email with different case
+- about 4% repeat a phone
+- names collide in groups of 20
+- every thousandth contact shares one office phone
+Everything happens in one transaction that is rolled back, so nothing is left behind.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.conf.config import config
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+
+CREATE_USER = """
+INSERT INTO users (username, email, password, role, confirmed)
+VALUES ('dedup_bench', 'dedup_bench@bench.test', '-', 'user', true)
+RETURNING id
+"""
+
+# change_seq is set explicitly so the benchmark does not consume the real sequence
+FILL = """
+INSERT INTO contacts (first_name, last_name, email, phone, birthday, created_at, user_id,
+                      email_normalized, phone_normalized, name_key, change_seq)
+SELECT 'First' || (g % :names), 'Last' || (g % :names),
+       CASE WHEN g % 20 = 0 THEN 'Bench' || (g - 1) ELSE 'bench' || g END || '@bench.test',
+       phone, date '1960-01-01' + (g % 18000), now(), :user_id,
+       'bench' || CASE WHEN g % 20 = 0 THEN g - 1 ELSE g END || '@bench.test',
+       phone, 'F' || (g % :names), 0
+FROM generate_series(1, :contacts) AS g,
+     LATERAL (SELECT CASE WHEN g % 1000 = 7 THEN '+380441234567'
+                          ELSE '+38067' || lpad((CASE WHEN g % 25 = 0 THEN g - 1 ELSE g END)::text, 7, '0')
+                     END AS phone) AS p
+"""
+
+
+async def run(args) -> None:
+    engine = create_async_engine(config.DB_URL)
+    try:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                user_id = (await conn.execute(text(CREATE_USER))).scalar()
+                started = time.perf_counter()
+                await conn.execute(text(FILL), {"user_id": user_id, "contacts": args.contacts,
+                                                "names": max(args.contacts // 20, 1)})
+                await conn.execute(text("ANALYZE contacts"))
+                print(f"seeded {args.contacts} contacts in {time.perf_counter() - started:.1f} s")
+
+                async with AsyncSession(bind=conn) as db:
+                    user = await db.get(User, user_id)
+                    print(f"{'page':>6} {'groups':>7} {'largest':>8} {'ms':>9}")
+                    timings = []
+                    for page in range(args.pages):
+                        started = time.perf_counter()
+                        groups = await repository_contacts.find_duplicates(
+                            user, db, args.page_size, page * args.page_size)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        largest = max((group["size"] for group in groups), default=0)
+                        print(f"{page:>6} {len(groups):>7} {largest:>8} {timings[-1]:9.1f}")
+                    print(f"median {statistics.median(timings):.1f} ms per page of {args.page_size} groups")
+            finally:
+                await transaction.rollback()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time duplicate detection for one user with many contacts")
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=100)
+    asyncio.run(run(parser.parse_args()))
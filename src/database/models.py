@@ -1,10 +1,18 @@
 import enum
-from sqlalchemy import Column, Integer, String, DateTime, func, Date, ForeignKey,  Enum, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, func, Date, ForeignKey,  Enum, Boolean, Index, \
+    Sequence, event, select
 
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, Session
 from datetime import datetime, date
 
 from src.database.db import Base
+from src.services.normalize import normalize_email, normalize_phone, name_key
+
+# every insert and update of a contact takes the next value, clients sync from the last one they saw
+contacts_change_seq = Sequence('contacts_change_seq')
+# first key of the (CONTACT_WRITE_LOCK, user_id) advisory locks taken by lock_contact_owners
+CONTACT_WRITE_LOCK = 0x636f6e74
+
 
 class Contact(Base):
     __tablename__ = "contacts" # noqa
@@ -15,8 +23,45 @@ class Contact(Base):
     phone: Mapped[str] = Column(String)
     birthday: Mapped[str] = Column(Date)
     created_at: Mapped[int] = Column(DateTime, default=func.now())
+    updated_at: Mapped[datetime] = Column(DateTime, default=func.now(), onupdate=func.now())
+    deleted_at: Mapped[datetime] = Column(DateTime, nullable=True)
+    change_seq: Mapped[int] = Column(BigInteger, contacts_change_seq, onupdate=contacts_change_seq.next_value(),
+                                     server_default=contacts_change_seq.next_value())
     user_id: Mapped[int] = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user: Mapped["User"] = relationship('User', backref="users")
+    # blocking keys for duplicate detection, filled in by normalize_contact
+    email_normalized: Mapped[str] = Column(String)
+    phone_normalized: Mapped[str] = Column(String)
+    name_key: Mapped[str] = Column(String)
+
+    __table_args__ = (
+        Index('ix_contacts_user_id_email_normalized', 'user_id', 'email_normalized'),
+        Index('ix_contacts_user_id_phone_normalized', 'user_id', 'phone_normalized'),
+        Index('ix_contacts_user_id_name_key', 'user_id', 'name_key'),
+        Index('ix_contacts_user_id_change_seq', 'user_id', 'change_seq'),
+    )
+    # generated columns come back with INSERT/UPDATE ... RETURNING instead of a refresh query
+    __mapper_args__ = {"eager_defaults": True}
+
+
+@event.listens_for(Contact, "before_insert")
+@event.listens_for(Contact, "before_update")
+def normalize_contact(mapper, connection, target: Contact):
+    target.email_normalized = normalize_email(target.email)
+    target.phone_normalized = normalize_phone(target.phone)
+    target.name_key = name_key(target.first_name, target.last_name)
+
+
+@event.listens_for(Session, "before_flush")
+def lock_contact_owners(session, flush_context, instances):
+    # change_seq is drawn at flush but becomes visible at commit, so two transactions could
+    # commit 11 before 10 and a client that synced up to 11 would never see 10. Holding a
+    # per-owner lock from before the draw until commit keeps one owner's changes in order,
+    # which is all the per-user change feed and contacts_version rely on.
+    owners = {obj.user_id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, Contact)}
+    for user_id in sorted(owner for owner in owners if owner is not None):
+        session.connection().execute(select(func.pg_advisory_xact_lock(CONTACT_WRITE_LOCK, user_id)))
+
 
 class Role(enum.Enum):
     admin: str = "admin"
@@ -37,3 +82,15 @@ class User(Base):
     confirmed: Mapped[bool] = Column(Boolean, default=False)
 
 
+class EmailOpen(Base):
+    __tablename__ = "email_opens"
+    id: Mapped[int] = Column(BigInteger, primary_key=True)
+    username: Mapped[str] = Column(String(50), nullable=False)
+    opened_at: Mapped[datetime] = Column(DateTime, nullable=False)
+
+
+class EmailOpenStats(Base):
+    __tablename__ = "email_open_stats"
+    username: Mapped[str] = Column(String(50), primary_key=True)
+    opens: Mapped[int] = Column(BigInteger, nullable=False, default=0)
+    last_opened_at: Mapped[datetime] = Column(DateTime)
@@ -0,0 +1,96 @@
+"""
+Per-user query latency on a plain vs a hash-partitioned contacts layout.
+
+    python -m src.database.partition_bench --users 2000 --contacts 1000000 --partitions 16
+
+Builds two scratch tables shaped like ``contacts`` (one plain, one partitioned by
+HASH(user_id)), fills both with the same generated rows and runs the per-user
+queries the repository issues against each. Everything happens in one transaction
+that is rolled back, so the real tables are not touched.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.conf.config import config
+
+COLUMNS = """
+    id bigint NOT NULL, user_id integer NOT NULL, first_name varchar, last_name varchar, email varchar,
+    phone_normalized varchar, birthday date, deleted_at timestamp, change_seq bigint
+"""
+
+FILL = """
+INSERT INTO {table}
+SELECT g, 1 + g % :users, 'First' || (g % 5000), 'Last' || (g % 7000), 'bench_' || g || '@bench.test',
+       '+38067' || lpad(g::text, 7, '0'), date '1960-01-01' + (g % 18000), NULL, g
+FROM generate_series(1, :contacts) AS g
+"""
+
+QUERIES = {
+    "list": "SELECT * FROM {table} WHERE user_id = :user_id AND deleted_at IS NULL",
+    "by_phone": "SELECT * FROM {table} WHERE user_id = :user_id AND phone_normalized = :phone",
+    "changes": "SELECT * FROM {table} WHERE user_id = :user_id AND change_seq > :since ORDER BY change_seq LIMIT 500",
+}
+
+
+async def create_tables(conn, partitions: int, users: int, contacts: int) -> None:
+    await conn.execute(text(f"CREATE TEMP TABLE bench_plain ({COLUMNS})"))
+    await conn.execute(text(f"CREATE TEMP TABLE bench_hash ({COLUMNS}) PARTITION BY HASH (user_id)"))
+    for remainder in range(partitions):
+        await conn.execute(text(f"CREATE TEMP TABLE bench_hash_{remainder} PARTITION OF bench_hash "
+                                f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"))
+    for table in ("bench_plain", "bench_hash"):
+        await conn.execute(text(FILL.format(table=table)), {"users": users, "contacts": contacts})
+        await conn.execute(text(f"CREATE INDEX ON {table} (user_id, phone_normalized)"))
+        await conn.execute(text(f"CREATE INDEX ON {table} (user_id, change_seq)"))
+        await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def measure(conn, table: str, query: str, samples: list[dict]) -> list[float]:
+    statement = text(QUERIES[query].format(table=table))
+    timings = []
+    for params in samples:
+        start = time.perf_counter()
+        await conn.execute(statement, params)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def run(args) -> None:
+    engine = create_async_engine(config.DB_URL)
+    try:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                await create_tables(conn, args.partitions, args.users, args.contacts)
+                samples = []
+                for _ in range(args.queries):
+                    user_id = random.randint(1, args.users)
+                    samples.append({"user_id": user_id, "phone": f"+38067{user_id:07d}", "since": 0})
+                print(f"{args.contacts} contacts, {args.users} users, {args.partitions} partitions, "
+                      f"{args.queries} queries each")
+                print(f"{'query':<10} {'layout':<12} {'p50 ms':>8} {'p95 ms':>8}")
+                for query in QUERIES:
+                    for table in ("bench_plain", "bench_hash"):
+                        await measure(conn, table, query, samples[:20])  # warm the cache
+                        timings = sorted(await measure(conn, table, query, samples))
+                        p95 = timings[int(len(timings) * 0.95) - 1]
+                        print(f"{query:<10} {table[6:]:<12} {statistics.median(timings):8.2f} {p95:8.2f}")
+            finally:
+                await transaction.rollback()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare per-user query latency, plain vs partitioned")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--contacts", type=int, default=1_000_000)
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=500)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,149 @@
+"""
+Query plan check for the repository functions.
+
+    python -m src.database.plans --users 1000 --contacts 200000 --out plans
+
+Seeds users and contacts into the Postgres from DB_URL inside one transaction,
+runs ANALYZE, then calls every repository function listed in CHECKS. Each SELECT
+they issue is captured with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and written
+to ``--out`` as an artifact. The exit status is 1 when a hot path sequentially
+scans more than ``--max-seq-rows`` rows. The transaction is rolled back at the
+end, so the database is left as it was. Point DB_URL at a scratch database anyway.
+"""
+import argparse
+import asyncio
+import json
+import sys
+from datetime import date
+from pathlib import Path
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.conf.config import config
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+
+SEED_USERS = """
+INSERT INTO users (username, email, password, confirmed, role, crated_at, update_at)
+SELECT 'plan_user_' || g, 'plan_user_' || g || '@plans.test', 'x', true, 'user', now(), now()
+FROM generate_series(1, :users) AS g
+RETURNING id
+"""
+
+# change_seq is set explicitly so the rolled back seed does not consume the real sequence
+SEED_CONTACTS = """
+INSERT INTO contacts (first_name, last_name, email, phone, birthday, created_at, updated_at, user_id,
+                      email_normalized, phone_normalized, name_key, change_seq)
+SELECT 'First' || (g % 5000), 'Last' || (g % 7000), 'plan_contact_' || g || '@plans.test',
+       '+38067' || lpad(g::text, 7, '0'), date '1960-01-01' + (g % 18000), now(), now(),
+       :first_user + (g % :users), 'plan_contact_' || g || '@plans.test',
+       '+38067' || lpad(g::text, 7, '0'), 'F' || (g % 5000) || ' L' || (g % 7000), g
+FROM generate_series(1, :contacts) AS g
+"""
+
+
+class PlanRecorder:
+    """Runs EXPLAIN for every SELECT that goes through the engine while ``name`` is set."""
+
+    def __init__(self):
+        self.name = None
+        self.plans: dict[str, list] = {}
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.name is None or not statement.lstrip().upper().startswith("SELECT"):
+            return
+        cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}", parameters)
+        plan = cursor.fetchall()[0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        self.plans.setdefault(self.name, []).append({"statement": statement, "plan": plan})
+
+
+def seq_scans(node: dict):
+    if node.get("Node Type") == "Seq Scan":
+        scanned = node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)
+        yield node.get("Relation Name"), scanned
+    for child in node.get("Plans", ()):
+        yield from seq_scans(child)
+
+
+def checks(user: User, contact_id: int, phone: str):
+    """(name, hot path, coroutine factory); hot paths must not seq scan."""
+    return [
+        ("users.get_user_by_email", True, lambda db: repository_users.get_user_by_email(user.email, db)),
+        ("contacts.get_contact", True, lambda db: repository_contacts.get_contact(contact_id, db, user)),
+        ("contacts.get_contacts_by_phone", True,
+         lambda db: repository_contacts.get_contacts_by_phone(phone, user, db)),
+        ("contacts.get_contacts_by_phones", True,
+         lambda db: repository_contacts.get_contacts_by_phones([phone, "+380000000000"], user, db)),
+        ("contacts.get_changes", True, lambda db: repository_contacts.get_changes(0, user, db)),
+        ("contacts.find_duplicates", True, lambda db: repository_contacts.find_duplicates(user, db)),
+        ("contacts.get_all_contacts", False, lambda db: repository_contacts.get_all_contacts(10, 0, db)),
+        # substring ilike and month/day extraction can't use the indexes; recorded as notes
+        ("contacts.search", False, lambda db: repository_contacts._search("First1", "Last1", "plan", user, db)),
+        ("contacts.upcoming_birthdays", False, lambda db: repository_contacts._upcoming_birthdays(user, db)),
+    ]
+
+
+async def run(args) -> int:
+    engine = create_async_engine(config.DB_URL)
+    recorder = PlanRecorder()
+    event.listen(engine.sync_engine, "before_cursor_execute", recorder.before_cursor_execute)
+    failures = []
+    try:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                result = await conn.execute(text(SEED_USERS), {"users": args.users})
+                first_user = min(row.id for row in result)
+                await conn.execute(text(SEED_CONTACTS), {"users": args.users, "contacts": args.contacts,
+                                                         "first_user": first_user})
+                await conn.execute(text("ANALYZE users"))
+                await conn.execute(text("ANALYZE contacts"))
+                contact = (await conn.execute(text(
+                    "SELECT id, phone_normalized FROM contacts WHERE user_id = :user_id LIMIT 1"
+                ), {"user_id": first_user})).one()
+
+                db = AsyncSession(bind=conn, join_transaction_mode="create_savepoint")
+                user = await db.get(User, first_user)
+                for name, hot, call in checks(user, contact.id, contact.phone_normalized):
+                    recorder.name = name
+                    await call(db)
+                    recorder.name = None
+                    for captured in recorder.plans.get(name, ()):
+                        for relation, rows in seq_scans(captured["plan"][0]["Plan"]):
+                            line = f"{name}: Seq Scan on {relation} ({rows} rows)"
+                            if hot and rows > args.max_seq_rows:
+                                failures.append(line)
+                            else:
+                                print(f"note  {line}")
+                await db.close()
+            finally:
+                await transaction.rollback()
+    finally:
+        await engine.dispose()
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    for name, captured in recorder.plans.items():
+        (out / f"{name}.json").write_text(json.dumps(captured, indent=2, default=str))
+    (out / "summary.json").write_text(json.dumps({
+        "date": date.today().isoformat(), "users": args.users, "contacts": args.contacts,
+        "max_seq_rows": args.max_seq_rows, "failures": failures,
+    }, indent=2))
+
+    for line in failures:
+        print(f"FAIL  {line}", file=sys.stderr)
+    print(f"{len(recorder.plans)} functions checked, plans written to {out}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EXPLAIN the repository queries on seeded data")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--contacts", type=int, default=200_000)
+    parser.add_argument("--max-seq-rows", type=int, default=1000)
+    parser.add_argument("--out", default="plans")
+    sys.exit(asyncio.run(run(parser.parse_args())))
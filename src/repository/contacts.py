@@ -1,22 +1,56 @@
 from datetime import date, timedelta
 from fastapi import HTTPException, status
-from typing import List, Optional
+from typing import Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, func, literal, union_all, Integer, String, cast
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from src.database.db import sessionmanager
 from src.database.models import Contact, User
 from src.schemas import ContactCreateModel, ContactUpdateModel, ContactModel
+from src.services.normalize import normalize_phone
+from src.services.singleflight import SingleFlight
 from sqlalchemy import extract
 
+# deleted contacts stay in the table as tombstones for the change feed
+active = Contact.deleted_at.is_(None)
+
+
+def owned(user: User):
+    # equality on user_id lets Postgres prune to one partition when contacts is partitioned
+    return Contact.user_id == user.id
+
+
+async def contacts_version(db: AsyncSession, user: User) -> int:
+    """Changes whenever a contact of ``user`` is created, updated or deleted."""
+    # answered from the end of the (user_id, change_seq) index; one owner's changes commit in
+    # change_seq order (see models.lock_contact_owners), so a late commit can't hide below it
+    result = await db.execute(select(func.max(Contact.change_seq)).filter(owned(user)))
+    return result.scalar() or 0
+
+
+async def page_version(limit: int, offset: int, db: AsyncSession) -> str:
+    """Changes whenever a contact on this page of get_all_contacts changes, or the page shifts."""
+    # different owners' changes commit in any order, so the sequence can't version the whole table
+    page = select(Contact.id, Contact.change_seq).filter(active).order_by(Contact.id) \
+        .offset(offset).limit(limit).subquery()
+    pairs = cast(page.c.id, String) + ":" + cast(page.c.change_seq, String)
+    result = await db.execute(select(func.md5(func.string_agg(pairs, aggregate_order_by(literal(","), page.c.id)))))
+    return result.scalar() or "empty"
+
+
 async def get_all_contacts(limit: int, offset: int, db: AsyncSession):
-    sq = select(Contact).offset(offset).limit(limit)
+    sq = select(Contact).filter(active).order_by(Contact.id).offset(offset).limit(limit)
     result = await db.execute(sq)
     contacts = result.scalars().all()
     return contacts
 
 
 
-async def get_contact(contact_id: int, db: AsyncSession) -> Optional[ContactModel]:
-    contact = await db.execute(select(Contact).filter(Contact.id == contact_id))
+async def get_contact(contact_id: int, db: AsyncSession, user: User | None = None) -> Optional[ContactModel]:
+    sq = select(Contact).filter(Contact.id == contact_id, active)
+    if user is not None:
+        sq = sq.filter(owned(user))
+    contact = await db.execute(sq)
     db_contact = contact.scalar()
     if not db_contact:
         return None
@@ -32,29 +66,53 @@ async def get_contact(contact_id: int, db: AsyncSession) -> Optional[ContactMode
 
 
 async def put_contact(contact_id: int, contact_update: ContactUpdateModel, db: AsyncSession):
-    db_contact = await db.execute(select(Contact).filter(Contact.id == contact_id))
+    db_contact = await db.execute(select(Contact).filter(Contact.id == contact_id, active))
     contact = db_contact.scalar()
     for field, value in contact_update.dict(exclude_unset=True).items():
         setattr(contact, field, value)
-    await db.commit()
-    await db.refresh(contact)
+    await db.flush()
     return contact
 
 
 
 async def del_contact(contact_id: int, user: User, db: AsyncSession):
-    contact = await db.execute(select(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id))).scalar()
+    result = await db.execute(select(Contact).filter(and_(Contact.id == contact_id, owned(user)), active))
+    contact = result.scalar()
     if not contact:
         return None
-    db.delete(contact)
-    await db.commit()
+    contact.deleted_at = func.now()
+    contact.email = None  # frees the unique email for a new contact
+    await db.flush()
     return contact
 
 
-async def search(first_name: str, last_name: str, email: str, user: User, db: AsyncSession):
+# concurrent identical reads of one owner share a single query
+search_flight = SingleFlight("contacts.search")
+birthdays_flight = SingleFlight("contacts.upcoming_birthdays")
+
+
+async def in_own_session(query, *args):
+    # the shared call outlives any single caller; a request's session is closed
+    # (and its connection returned) as soon as that request ends or is cancelled
+    async with sessionmanager.session() as db:
+        return await query(*args, db)
+
+
+async def search(first_name: str, last_name: str, email: str, user: User, version: int):
+    """
+    ``version`` is the contacts_version the caller built its ETag from. It is part of the
+    key, so a request never joins a query that started before a change it has already seen.
+    """
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized")
-    query = select(Contact).filter(
+    # ilike is case insensitive, so differently cased searches are the same query
+    key = (user.id, version,
+           *(value.lower() if value is not None else None for value in (first_name, last_name, email)))
+    return await search_flight.do(key, lambda: in_own_session(_search, first_name, last_name, email, user))
+
+
+async def _search(first_name: str, last_name: str, email: str, user: User, db: AsyncSession):
+    query = select(Contact).filter(owned(user), active).filter(
         (Contact.first_name.ilike(f'%{first_name}%')) |
         (Contact.last_name.ilike(f'%{last_name}%')) |
         (Contact.email.ilike(f'%{email}%'))
@@ -66,14 +124,125 @@ async def search(first_name: str, last_name: str, email: str, user: User, db: As
 
 
 
-async def upcoming_birthdays(db: AsyncSession) -> List[Contact]:
+async def upcoming_birthdays(user: User | None = None, version: int | None = None) -> List[Contact]:
+    # version as in search()
+    key = (user.id if user is not None else None, version, date.today())
+    return await birthdays_flight.do(key, lambda: in_own_session(_upcoming_birthdays, user))
+
+
+async def _upcoming_birthdays(user: User | None, db: AsyncSession) -> List[Contact]:
     today = date.today()
     next_week = today + timedelta(days=7)
     #async with db.begin():
-    statement = select(Contact).filter(
+    statement = select(Contact).filter(active)
+    if user is not None:
+        statement = statement.filter(owned(user))
+    statement = statement.filter(
         (extract('month', Contact.birthday) == today.month) &
         (extract('day', Contact.birthday) >= today.day) &
         (extract('day', Contact.birthday) <= next_week.day)
     )
     contacts = await db.execute(statement)
     return contacts.scalars().all()
+
+
+
+async def get_contacts_by_phone(phone: str, user: User, db: AsyncSession) -> List[Contact]:
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return []
+    result = await db.execute(select(Contact).filter(
+        owned(user), Contact.phone_normalized == normalized, active))
+    return result.scalars().all()
+
+
+async def get_contacts_by_phones(phones: List[str], user: User, db: AsyncSession) -> Dict[str, List[Contact]]:
+    # one indexed IN query for the whole batch, results are keyed by the phone as it was sent
+    normalized = {phone: normalize_phone(phone) for phone in phones}
+    found = {}
+    wanted = {value for value in normalized.values() if value}
+    if wanted:
+        result = await db.execute(select(Contact).filter(
+            owned(user), Contact.phone_normalized.in_(wanted), active))
+        for contact in result.scalars():
+            found.setdefault(contact.phone_normalized, []).append(contact)
+    return {phone: found.get(value, []) for phone, value in normalized.items()}
+
+
+# columns holding the blocking keys; contacts sharing a value in any of them are candidates
+DUPLICATE_KEYS = {"email": Contact.email_normalized, "phone": Contact.phone_normalized, "name": Contact.name_key}
+# a shared office phone or a common name can match hundreds of contacts; only this many are loaded
+MAX_GROUP_SIZE = 50
+MERGE_FIELDS = ("first_name", "last_name", "email", "phone", "birthday")
+
+
+async def find_duplicates(user: User, db: AsyncSession, limit: int = 100, offset: int = 0) -> List[dict]:
+    """
+    Groups of contacts sharing one blocking key, ordered by their lowest contact id.
+
+    Groups are reported per key rather than merged transitively, so a coarse name key
+    and a shared phone cannot chain unrelated people into one group. ``size`` is the
+    full group size; only the first MAX_GROUP_SIZE contacts of a group are returned.
+    """
+    groups = union_all(*(
+        select(
+            literal(name).label("key"),
+            column.label("value"),
+            func.count().label("size"),
+            func.min(Contact.id).label("first_id"),
+            func.array_agg(aggregate_order_by(Contact.id, Contact.id), type_=ARRAY(Integer))[1:MAX_GROUP_SIZE].label("ids"),
+        ).filter(owned(user), column.isnot(None), active).group_by(column).having(func.count() > 1)
+        for name, column in DUPLICATE_KEYS.items()
+    )).subquery()
+    statement = select(groups).order_by(groups.c.first_id, groups.c.key, groups.c.value).offset(offset).limit(limit)
+    groups = (await db.execute(statement)).all()
+    if not groups:
+        return []
+
+    ids = {contact_id for group in groups for contact_id in group.ids}
+    result = await db.execute(select(Contact).filter(Contact.id.in_(ids), owned(user), active))
+    contacts = {contact.id: contact for contact in result.scalars()}
+    return [
+        {"key": group.key, "value": group.value, "size": group.size,
+         "contacts": [contacts[contact_id] for contact_id in group.ids if contact_id in contacts]}
+        for group in groups
+    ]
+
+
+async def merge_contacts(primary_id: int, duplicate_ids: List[int], user: User, db: AsyncSession) -> Optional[Contact]:
+    duplicate_ids = set(duplicate_ids) - {primary_id}
+    result = await db.execute(select(Contact).filter(
+        Contact.id.in_(duplicate_ids | {primary_id}), owned(user), active))
+    contacts = {contact.id: contact for contact in result.scalars()}
+    primary = contacts.pop(primary_id, None)
+    if primary is None or len(contacts) != len(duplicate_ids):
+        return None
+
+    values = {}
+    for duplicate in sorted(contacts.values(), key=lambda contact: contact.id):
+        for field in MERGE_FIELDS:
+            if not getattr(primary, field) and not values.get(field) and getattr(duplicate, field):
+                values[field] = getattr(duplicate, field)
+        duplicate.deleted_at = func.now()
+        duplicate.email = None
+    # duplicates go first, otherwise a copied email would hit the unique index
+    await db.flush()
+    for field, value in values.items():
+        setattr(primary, field, value)
+    await db.flush()
+    return primary
+
+
+async def get_changes(since: int, user: User, db: AsyncSession, limit: int = 500):
+    """Contacts changed after change_seq ``since``: (changed, deleted ids, next token, has more)."""
+    statement = select(Contact).filter(
+        owned(user), Contact.change_seq > since
+    ).order_by(Contact.change_seq).limit(limit + 1)
+    result = await db.execute(statement)
+    contacts = result.scalars().all()
+    has_more = len(contacts) > limit
+    contacts = contacts[:limit]
+    changed = [contact for contact in contacts if contact.deleted_at is None]
+    deleted = [contact.id for contact in contacts if contact.deleted_at is not None]
+    next_seq = contacts[-1].change_seq if contacts else since
+    return changed, deleted, next_seq, has_more
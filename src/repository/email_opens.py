@@ -0,0 +1,34 @@
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import EmailOpen, EmailOpenStats
+
+
+async def save_opens(events: List[Tuple[str, datetime]], db: AsyncSession) -> None:
+    # one multi-row INSERT for the events and one upsert for the per-user counters
+    await db.execute(insert(EmailOpen).values([
+        {"username": username, "opened_at": opened_at} for username, opened_at in events
+    ]))
+    counts = Counter(username for username, _ in events)
+    last = {}
+    for username, opened_at in events:
+        last[username] = max(opened_at, last.get(username, opened_at))
+    statement = pg_insert(EmailOpenStats).values([
+        {"username": username, "opens": count, "last_opened_at": last[username]}
+        for username, count in counts.items()
+    ])
+    statement = statement.on_conflict_do_update(index_elements=[EmailOpenStats.username], set_={
+        "opens": EmailOpenStats.opens + statement.excluded.opens,
+        "last_opened_at": func.greatest(EmailOpenStats.last_opened_at, statement.excluded.last_opened_at),
+    })
+    await db.execute(statement)
+
+
+async def get_open_stats(username: str, db: AsyncSession) -> Optional[EmailOpenStats]:
+    result = await db.execute(select(EmailOpenStats).filter(EmailOpenStats.username == username))
+    return result.scalar_one_or_none()
@@ -1,13 +1,10 @@
 import logging
 import secrets
-from libgravatar import Gravatar
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_mail import MessageSchema, MessageType, FastMail
 
 from src.database.models import User
 from src.schemas import UserSchema
-from src.services.email import conf
 
 
 async def get_user_by_email(email: str, db: AsyncSession) -> User:
@@ -18,28 +15,18 @@ async def get_user_by_email(email: str, db: AsyncSession) -> User:
     return user
 
 
-async def create_user(body: UserSchema, db: AsyncSession) -> User:
-    avatar = None
-    try:
-        g = Gravatar(body.email)
-        avatar = g.get_image()
-    except Exception as e:
-        logging.error(e)
+async def create_user(body: UserSchema, db: AsyncSession, avatar: str | None = None) -> User:
     new_user = User(**body.model_dump(), avatar=avatar)
     db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
+    await db.flush()
     return new_user
 
 
 async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     user.refresh_token = token
-    await db.commit()
 
-async def confirmed_email(email: str, db: AsyncSession) -> None:
-    user = await get_user_by_email(email, db)
+async def confirmed_email(user: User, db: AsyncSession) -> None:
     user.confirmed = True
-    await db.commit()
 
 async def generate_reset_token() -> str:
     # Генеруємо випадковий токен з використанням модуля secrets
@@ -52,11 +39,15 @@ async def get_user_by_reset_token(reset_token: str, db: AsyncSession) -> User:
     user = result.scalar_one_or_none()
     return user
 
-async def update_user_password(email, hashed_password, db: AsyncSession) -> None:
-    user = await get_user_by_email(email, db)
+async def update_user_password(user: User, hashed_password, db: AsyncSession) -> None:
     user.password = hashed_password
-    db.commit()
 
-async def update_avatar(user: User, avatar_url: str, db: AsyncSession) -> None:
+async def update_avatar(user: User, avatar_url: str, db: AsyncSession) -> User:
     user.avatar = avatar_url
-    await db.commit()
+    return user
+
+
+async def set_default_avatar(user_id: int, default: str, avatar_url: str, db: AsyncSession) -> None:
+    # only replaces the placeholder, so an avatar uploaded in the meantime wins
+    await db.execute(update(User).where(User.id == user_id, User.avatar == default).values(avatar=avatar_url))
+
@@ -1,22 +1,26 @@
+import logging
 from typing import List
 
 from fastapi import APIRouter, HTTPException, Depends, status, Security, Request, BackgroundTasks, UploadFile, File
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from fastapi.responses import RedirectResponse
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
-import cloudinary
-import cloudinary.uploader
 from src.conf.config import config
 from src.database.db import get_db
 from src.database.models import User
-from src.schemas import UserSchema, UserResponseSchema, TokenModel, ResetPasswordRequest
+from src.schemas import UserSchema, UserResponseSchema, TokenModel, ResetPasswordRequest, EmailOpenStatsSchema
 from src.repository import users as repository_users
+from src.repository import email_opens as repository_opens
+from src.services import avatar as avatar_service
 from src.services.auth import auth_service
 from src.services.email import send_email, send_reset_password_email
+from src.services.static import PIXEL
+from src.services.tracking import tracker
 
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
+opens_log = logging.getLogger("email.opens")  # one record per opened email, sampled by log_sample
 
 
 @router.post("/signup", status_code=status.HTTP_201_CREATED)
@@ -25,8 +29,10 @@ async def signup(body: UserSchema, background_tasks: BackgroundTasks, request: R
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
+    body.password = await auth_service.hash_password(body.password)
+    new_user = await repository_users.create_user(body, db, avatar=avatar_service.DEFAULT_AVATAR)
+    await db.commit()
+    background_tasks.add_task(avatar_service.resolve_avatar, new_user.id, new_user.email)
     background_tasks.add_task(send_email, new_user.email, new_user.username, str(request.base_url))
     return {"detail": "User successfully created"}
 
@@ -38,12 +44,17 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash is not None:
+        # hash parameters changed since this password was set
+        await repository_users.update_user_password(user, new_hash, db)
     # Generate JWT
-    access_token = await auth_service.create_access_token(data={"sub": user.email})
+    access_token = await auth_service.create_access_token(data=auth_service.access_claims(user))
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
     await repository_users.update_token(user, refresh_token, db)
+    await db.commit()
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
@@ -55,20 +66,30 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
     user = await repository_users.get_user_by_email(email, db)
     if user.refresh_token != token:
         await repository_users.update_token(user, None, db)
+        await db.commit()
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
+    access_token = await auth_service.create_access_token(data=auth_service.access_claims(user))
     refresh_token = await auth_service.create_refresh_token(data={"sub": email})
     await repository_users.update_token(user, refresh_token, db)
+    await db.commit()
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 
 @router.get('/{username}')
-async def refresh_token(username: str, db: AsyncSession = Depends(get_db)):
-    print("----------------------")
-    print(f"{username} open email")
-    print("----------------------")
-    return RedirectResponse("http://localhost:8000/static/check.png")
+async def refresh_token(username: str):
+    tracker.record(username)
+    opens_log.info("Email opened", extra={"username": username})
+    # the pixel itself instead of a redirect to it: one round trip per opened email
+    return Response(content=PIXEL, media_type="image/gif", headers={"Cache-Control": "private, no-cache"})
+
+@router.get('/opens/me', response_model=EmailOpenStatsSchema)
+async def email_opens(current_user: User = Depends(auth_service.get_current_user),
+                      db: AsyncSession = Depends(get_db)):
+    stats = await repository_opens.get_open_stats(current_user.username, db)
+    if stats is None:
+        return EmailOpenStatsSchema(username=current_user.username)
+    return stats
 
 @router.get('/confirmed_email/{token}')
 async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
@@ -78,7 +99,8 @@ async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Verification error")
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
-    await repository_users.confirmed_email(email, db)
+    await repository_users.confirmed_email(user, db)
+    await db.commit()
     return {"message": "Email confirmed"}
 
 
@@ -105,10 +127,11 @@ async def reset_password(reset_data: ResetPasswordRequest, db: AsyncSession = De
 
     payload = auth_service.verify_reset_password_token(token)
     if payload is not None:
-        user = repository_users.get_user_by_email(email, db)
+        user = await repository_users.get_user_by_email(email, db)
         if user:
-            hashed_password = auth_service.get_password_hash(new_password)
-            await repository_users.update_user_password(email, hashed_password, db)
+            hashed_password = await auth_service.hash_password(new_password)
+            await repository_users.update_user_password(user, hashed_password, db)
+            await db.commit()
             return {"message": "Password reset successful"}
         else:
             raise HTTPException(
@@ -123,6 +146,8 @@ async def reset_password(reset_data: ResetPasswordRequest, db: AsyncSession = De
 @router.patch("/avatar", response_model=UserResponseSchema)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
                              db: AsyncSession = Depends(get_db)):
+    import cloudinary
+    import cloudinary.uploader
 
     cloudinary.config(
         cloud_name=config.cloudinary_name,
@@ -134,5 +159,6 @@ async def update_avatar_user(file: UploadFile = File(), current_user: User = Dep
     r = cloudinary.uploader.upload(file.file, public_id=f'ContactsApp/{current_user.username}', overwrite=True)
     src_url = cloudinary.CloudinaryImage(f'ContactsApp/{current_user.username}')\
                         .build_url(width=250, height=250, crop='fill', version=r.get('version'))
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
+    user = await repository_users.update_avatar(current_user, src_url, db)
+    await db.commit()
     return user
\ No newline at end of file
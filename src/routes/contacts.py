@@ -1,13 +1,20 @@
+import asyncio
+import logging
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 
 from ..database.db import get_db
 from ..database.models import Contact, User, Role
-from ..schemas import ContactCreateModel, ContactUpdateModel, ContactModel
+from ..schemas import ContactCreateModel, ContactUpdateModel, ContactModel, ContactMergeModel, PhoneBatchModel
 from src.repository import contacts as repository_contacts
-from src.services.auth import auth_service
+from src.conf.config import config
+from src.services.auth import auth_service, Principal
+from src.services.conditional import weak_etag, is_fresh
+from src.services.events import broker, format_sse, CLOSE
 from src.services.roles import RoseAccess
 
 router = APIRouter(prefix='/contacts')
@@ -18,29 +25,32 @@ access_to_all = RoseAccess([Role.admin, Role.moderator])
 async def create_contact(contact: ContactCreateModel, db: AsyncSession = Depends(get_db),
                          user: User = Depends(auth_service.get_current_user)):
     contact_data = contact.dict(exclude_unset=True)
-    db_contact = Contact(**contact_data)
+    db_contact = Contact(**contact_data, user_id=user.id)
     db.add(db_contact)
     await db.commit()
-    await db.refresh(db_contact)
+    await broker.publish(db_contact.user_id, {"type": "created", "id": db_contact.id})
     return db_contact
 
 
 @router.get("/all", dependencies=[Depends(access_to_all)])
-async def get_all(limit: int = 10, offset: int = 0, db: AsyncSession = Depends(get_db),
-                  user: User = Depends(auth_service.get_current_user)):
+async def get_all(request: Request, response: Response, limit: int = 10, offset: int = 0,
+                  db: AsyncSession = Depends(get_db)):
     try:
+        etag = weak_etag(await repository_contacts.page_version(limit, offset, db), "all", limit, offset)
+        if is_fresh(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         contacts = await repository_contacts.get_all_contacts(limit, offset, db)
         return {"contacts": contacts}  # Return as a dictionary with a "contacts" key
     except Exception as e:
-        # Log the error for debugging
-        print(f"Error: {str(e)}")
+        logging.exception(f"Listing contacts failed: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 @router.get("/read/{contact_id}")
 async def get_by_id(contact_id: int, db: AsyncSession = Depends(get_db),
                     user: User = Depends(auth_service.get_current_user)) -> Optional[ContactModel]:
-    contact = await repository_contacts.get_contact(contact_id, db)
+    contact = await repository_contacts.get_contact(contact_id, db, user)
     if not contact:
         raise HTTPException(status_code=404, detail="Контакт не знайдений")
     return contact
@@ -49,24 +59,26 @@ async def get_by_id(contact_id: int, db: AsyncSession = Depends(get_db),
 @router.put("/update/{contact_id}")
 async def update_contact(contact_id: int, contact_update: ContactUpdateModel, db: AsyncSession = Depends(get_db),
                          user: User = Depends(auth_service.get_current_user)):
-    db_contact = await db.execute(select(Contact).filter(Contact.id == contact_id))
+    db_contact = await db.execute(select(Contact).filter(
+        Contact.id == contact_id, Contact.user_id == user.id, Contact.deleted_at.is_(None)))
     contact = db_contact.scalar()
+    if not contact:
+        raise HTTPException(status_code=404, detail="Контакт не знайдений")
 
     for field, value in contact_update.dict(exclude_unset=True).items():
         setattr(contact, field, value)
     await db.commit()
-    await db.refresh(contact)
+    await broker.publish(contact.user_id, {"type": "updated", "id": contact.id})
     return {"message": "Контакт успішно оновлено", "контакт": contact}
 
 
 @router.delete("/delete/{contact_id}")
 async def delete_by_id(contact_id: int, db: AsyncSession = Depends(get_db),
                        user: User = Depends(auth_service.get_current_user)):
-    contact = await db.get(Contact, contact_id)
-    if not contact:
+    db_contact = await db.execute(select(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id))
+    contact = db_contact.scalar()
+    if not contact or contact.deleted_at is not None:
         raise HTTPException(status_code=404, detail="Контакт не знайдений")
-    await db.delete(contact)
-    await db.commit()
     contact_dict = {
         "id": contact.id,
         "first_name": contact.first_name,
@@ -75,25 +87,112 @@ async def delete_by_id(contact_id: int, db: AsyncSession = Depends(get_db),
         "phone": contact.phone,
         "birthday": contact.birthday
     }
+    # soft delete: the row stays as a tombstone for /changes
+    contact.deleted_at = func.now()
+    contact.email = None
+    await db.commit()
+    await broker.publish(contact.user_id, {"type": "deleted", "id": contact_id})
     return {"message": "Контакт успішно видалено", "контакт": contact_dict}
 
 
 @router.get("/search")
-async def search_contact(first_name: Optional[str] = Query(default=None),
+async def search_contact(request: Request, response: Response,
+                         first_name: Optional[str] = Query(default=None),
                          last_name: Optional[str] = Query(default=None),
                          email: Optional[str] = Query(default=None),
                          db: AsyncSession = Depends(get_db),
                          user: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.search(first_name, last_name, email, user, db)
+    version = await repository_contacts.contacts_version(db, user)
+    etag = weak_etag(version, "search", first_name, last_name, email)
+    if is_fresh(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    contacts = await repository_contacts.search(first_name, last_name, email, user, version)
+    if not contacts:
+        raise HTTPException(status_code=404, detail="Контакт не знайдений")
+    response.headers["ETag"] = etag
+    return contacts
+
+
+@router.get("/by_phone")
+async def get_by_phone(phone: str, db: AsyncSession = Depends(get_db),
+                       user: User = Depends(auth_service.get_current_user)):
+    contacts = await repository_contacts.get_contacts_by_phone(phone, user, db)
     if not contacts:
         raise HTTPException(status_code=404, detail="Контакт не знайдений")
     return contacts
 
 
+@router.post("/by_phone/batch")
+async def get_by_phones(body: PhoneBatchModel, db: AsyncSession = Depends(get_db),
+                        user: User = Depends(auth_service.get_current_user)):
+    results = await repository_contacts.get_contacts_by_phones(body.phones, user, db)
+    return {"results": results}
+
+
 @router.get("/upcoming_birthdays")
-async def upcoming_birthdays(db: AsyncSession = Depends(get_db),
+async def upcoming_birthdays(request: Request, response: Response, db: AsyncSession = Depends(get_db),
                              user: User = Depends(auth_service.get_current_user)):
-    birthdays = await repository_contacts.upcoming_birthdays(db)
+    # the list also depends on today's date
+    version = await repository_contacts.contacts_version(db, user)
+    etag = weak_etag(version, "birthdays", date.today())
+    if is_fresh(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    birthdays = await repository_contacts.upcoming_birthdays(user, version)
     if not birthdays:
         return "Немає днів народження в наступному тижні"
     return birthdays
+
+
+@router.get("/duplicates")
+async def find_duplicates(limit: int = Query(default=100, ge=1, le=1000), offset: int = Query(default=0, ge=0),
+                          db: AsyncSession = Depends(get_db), user: User = Depends(auth_service.get_current_user)):
+    groups = await repository_contacts.find_duplicates(user, db, limit, offset)
+    return {"groups": groups}
+
+
+@router.post("/merge")
+async def merge_contacts(body: ContactMergeModel, db: AsyncSession = Depends(get_db),
+                         user: User = Depends(auth_service.get_current_user)):
+    contact = await repository_contacts.merge_contacts(body.primary_id, body.duplicate_ids, user, db)
+    if not contact:
+        raise HTTPException(status_code=404, detail="Контакт не знайдений")
+    await db.commit()
+    for duplicate_id in set(body.duplicate_ids) - {body.primary_id}:
+        await broker.publish(user.id, {"type": "deleted", "id": duplicate_id})
+    await broker.publish(user.id, {"type": "updated", "id": contact.id})
+    return {"message": "Контакти успішно об'єднано", "контакт": contact}
+
+
+@router.get("/changes")
+async def get_changes(since: str = Query(default="0"), limit: int = Query(default=500, ge=1, le=5000),
+                      db: AsyncSession = Depends(get_db),
+                      user: User = Depends(auth_service.get_current_user)):
+    if not since.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    changed, deleted, next_seq, has_more = await repository_contacts.get_changes(int(since), user, db, limit)
+    return {"changes": changed, "deleted": deleted, "next": str(next_seq), "has_more": has_more}
+
+
+@router.get("/stream")
+async def stream_changes(principal: Principal = Depends(auth_service.get_principal)):
+    # principal comes from the token claims, so no pooled connection is held for the life of the stream
+    user_id = principal.id
+
+    async def event_stream():
+        queue = broker.subscribe(user_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=config.events_keep_alive)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is CLOSE:
+                    return
+                yield format_sse(event)
+        finally:
+            broker.unsubscribe(user_id, queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
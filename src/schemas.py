@@ -1,6 +1,6 @@
-from datetime import date
+from datetime import date, datetime
 from pydantic import BaseModel, Field, EmailStr
-from typing import Optional
+from typing import List, Optional
 
 
 
@@ -27,6 +27,16 @@ class UserResponseSchema(BaseModel):
 
 
 
+class EmailOpenStatsSchema(BaseModel):
+    username: str
+    opens: int = 0
+    last_opened_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+
 class TokenModel(BaseModel):
     access_token: str
     refresh_token: str
@@ -60,6 +70,15 @@ class ContactModel(BaseModel):
     phone: str
     birthday: date
 
+# Схема для об'єднання дублікатів
+class ContactMergeModel(BaseModel):
+    primary_id: int
+    duplicate_ids: List[int] = Field(min_length=1)
+
+# Схема для пошуку контактів за списком телефонів
+class PhoneBatchModel(BaseModel):
+    phones: List[str] = Field(min_length=1, max_length=1000)
+
 class ResetPasswordRequest(BaseModel):
     email: str
     token: str
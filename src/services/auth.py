@@ -1,28 +1,57 @@
+import logging
+from dataclasses import dataclass
+from functools import cached_property
 from typing import Optional, Dict
 
 from jose import JWTError, jwt
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
+from src.database.models import Role, User
 from src.repository import users as repository_users
 from src.conf.config import config
+from src.services.hashing import password_context
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Caller identity taken from the signed access token claims."""
+    id: int
+    email: str
+    role: Role
+
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = config.secret_key
     ALGORITHM = config.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+    @cached_property
+    def pwd_context(self):
+        return password_context()
+
     def verify_password(self, plain_password, hashed_password):
         return self.pwd_context.verify(plain_password, hashed_password)
 
     def get_password_hash(self, password: str):
         return self.pwd_context.hash(password)
 
+    # hashing is deliberately slow CPU work, so the async variants keep it off the event loop
+    async def hash_password(self, password: str) -> str:
+        return await run_in_threadpool(self.pwd_context.hash, password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """Checks the password; the second item is a new hash when the stored one uses outdated parameters."""
+        return await run_in_threadpool(self.pwd_context.verify_and_update, plain_password, hashed_password)
+
+    def warm_up(self):
+        # passlib loads the bcrypt backend lazily, on the first hash/verify call
+        self.pwd_context.dummy_verify()
+
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         to_encode = data.copy()
@@ -68,34 +97,66 @@ class Auth:
             email = payload["sub"]
             return email
         except JWTError as e:
-            print(e)
+            logging.warning(f"Invalid email verification token: {e}")
             raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
                                 detail="Invalid token for email verification")
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-        credentials_exception = HTTPException(
+    def credentials_exception(self):
+        return HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    def decode_access_token(self, request: Request, token: str) -> dict:
+        # decoded once per request, every auth dependency reuses the payload
+        payload = getattr(request.state, "token_payload", None)
+        if payload is not None:
+            return payload
         try:
-            # Decode JWT
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
-            raise credentials_exception
-
-        user = await repository_users.get_user_by_email(email, db)
+        except JWTError:
+            raise self.credentials_exception()
+        if payload.get('scope') != 'access_token' or payload.get("sub") is None:
+            raise self.credentials_exception()
+        request.state.token_payload = payload
+        return payload
+
+    async def get_current_user(self, request: Request, token: str = Depends(oauth2_scheme),
+                               db: AsyncSession = Depends(get_db)) -> User:
+        user = getattr(request.state, "user", None)
+        if user is not None:
+            return user
+
+        payload = self.decode_access_token(request, token)
+        user = await repository_users.get_user_by_email(payload["sub"], db)
         if user is None:
-            raise credentials_exception
+            raise self.credentials_exception()
+        request.state.user = user
         return user
 
+    async def get_principal(self, request: Request, token: str = Depends(oauth2_scheme),
+                            db: AsyncSession = Depends(get_db)) -> Principal:
+        """Identity for authorization checks; no database access when the token carries uid and role."""
+        principal = getattr(request.state, "principal", None)
+        if principal is not None:
+            return principal
+
+        payload = self.decode_access_token(request, token)
+        if "uid" in payload and "role" in payload:
+            principal = Principal(id=payload["uid"], email=payload["sub"], role=Role(payload["role"]))
+        else:
+            # tokens issued before role claims existed
+            user = await self.get_current_user(request, token, db)
+            principal = Principal(id=user.id, email=user.email, role=user.role)
+        request.state.principal = principal
+        return principal
+
+    @staticmethod
+    def access_claims(user: User) -> dict:
+        role = user.role or Role.user
+        return {"sub": user.email, "uid": user.id, "role": role.value}
+
     async def verify_reset_password_token(self, token: str) -> Dict[str, any]:
         try:
             payload = jwt.decode(token, self.SECRET_KEY, algorithms=self.ALGORITHM)
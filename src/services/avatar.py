@@ -0,0 +1,82 @@
+"""
+Gravatar resolution, kept off the signup request.
+
+New users get DEFAULT_AVATAR; resolve_avatar runs as a background task and swaps in
+the gravatar URL. URLs are a pure function of the email hash and are memoized in
+process. The optional existence check (``gravatar_check``) asks gravatar for
+``?d=404`` through one pooled HTTP client and caches the answer in Redis.
+``gravatar_base_url`` can point at the local stub server in src/services/gravatar_stub.py.
+"""
+import hashlib
+import logging
+from functools import lru_cache
+
+from src.conf.config import config
+from src.database.db import redis_client, sessionmanager
+from src.repository import users as repository_users
+
+DEFAULT_AVATAR = "/static/avatar.jpg"
+CACHE_TTL = 60 * 60 * 24
+
+_client = None
+
+
+@lru_cache(maxsize=10_000)
+def email_hash(email: str) -> str:
+    return hashlib.md5(email.strip().lower().encode()).hexdigest()
+
+
+def gravatar_url(email: str) -> str:
+    return f"{config.gravatar_base_url}/avatar/{email_hash(email)}"
+
+
+def get_client():
+    global _client
+    if _client is None:
+        import httpx
+        _client = httpx.AsyncClient(timeout=config.gravatar_timeout,
+                                    limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+    return _client
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def gravatar_exists(email: str) -> bool:
+    key = f"gravatar:{email_hash(email)}"
+    try:
+        cached = await redis_client.get(key)
+        if cached is not None:
+            return cached == b"1"
+    except Exception as err:
+        logging.error(err)
+
+    response = await get_client().head(gravatar_url(email), params={"d": "404"})
+    exists = response.status_code == 200
+    try:
+        await redis_client.set(key, b"1" if exists else b"0", ex=CACHE_TTL)
+    except Exception as err:
+        logging.error(err)
+    return exists
+
+
+async def find_avatar(email: str) -> str | None:
+    if config.gravatar_check and not await gravatar_exists(email):
+        return None
+    return gravatar_url(email)
+
+
+async def resolve_avatar(user_id: int, email: str) -> None:
+    try:
+        avatar = await find_avatar(email)
+        if avatar is None:
+            return
+        async with sessionmanager.session() as db:
+            await repository_users.set_default_avatar(user_id, DEFAULT_AVATAR, avatar, db)
+            await db.commit()
+    except Exception as err:
+        logging.error(err)
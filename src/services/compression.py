@@ -0,0 +1,151 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+brotli and zstd are used when their modules (``brotli``, ``zstandard``) are
+installed, gzip always works. Bodies smaller than ``compression_min_size`` are
+sent as they are. Streaming responses are compressed chunk by chunk. Already
+encoded responses, images and event streams are passed through untouched.
+"""
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from src.conf.config import config
+
+SKIP_TYPES = ("image/", "video/", "audio/", "text/event-stream", "application/gzip", "application/zip")
+
+
+class GzipCodec:
+    def __init__(self):
+        self._obj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class BrotliCodec:
+    def __init__(self):
+        import brotli
+        self._obj = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class ZstdCodec:
+    def __init__(self):
+        import zstandard
+        self._obj = zstandard.ZstdCompressor(level=3).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def available_codecs() -> dict:
+    codecs = {}
+    for encoding, codec, module in (("br", BrotliCodec, "brotli"), ("zstd", ZstdCodec, "zstandard")):
+        try:
+            __import__(module)
+            codecs[encoding] = codec
+        except ImportError:
+            pass
+    codecs["gzip"] = GzipCodec
+    return codecs
+
+
+def negotiate(accept_encoding: str, codecs: dict) -> str | None:
+    """Best encoding the client accepts, ties go to the order of ``codecs``."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best = None
+    for encoding in codecs:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[1]):
+            best = (encoding, quality)
+    return best[0] if best else None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int | None = None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else config.compression_min_size
+        self.codecs = available_codecs()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.codecs)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await CompressionResponder(self.app, encoding, self.codecs[encoding], self.minimum_size)(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(self, app, encoding: str, codec, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.codec = codec
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if self.passthrough:
+            return await self.send(message)
+
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or content_type.startswith(SKIP_TYPES):
+                self.passthrough = True
+                return await self.send(message)
+            # held back until the first body chunk tells us the size
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body":
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                await self.send(self.start_message)
+                return await self.send(message)
+            self.compressor = self.codec()
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if "content-length" in headers:
+                del headers["content-length"]
+            await self.send(self.start_message)
+
+        data = self.compressor.compress(body)
+        if not more_body:
+            data += self.compressor.finish()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
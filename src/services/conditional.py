@@ -0,0 +1,23 @@
+"""
+Weak ETags for contact lists.
+
+The tag is built from the request parameters and a contact version: the owner's
+repository.contacts.contacts_version, or page_version for the admin list of everyone's
+contacts. An unchanged list is answered with 304 before its rows are loaded.
+"""
+import hashlib
+
+from fastapi import Request
+
+
+def weak_etag(version: int | str, *parts) -> str:
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()[:16]
+    return f'W/"{digest}-{version}"'
+
+
+def is_fresh(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags
@@ -1,54 +1,87 @@
+import logging
+from functools import lru_cache
 from pathlib import Path
-import uvicorn
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
 from src.conf.config import config
 from src.services.auth import auth_service
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.mail_username,
-    MAIL_PASSWORD=config.mail_password,
-    MAIL_FROM=config.mail_from,
-    MAIL_PORT=config.mail_port,
-    MAIL_SERVER=config.mail_server,
-    MAIL_FROM_NAME="Register mail",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
-print(config.mail_from, config.mail_password)
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
+
+
+# fastapi_mail and jinja2 are only needed once a mail is actually sent, so they are
+# imported on first use (or by warm_up in the app lifespan) rather than at import time.
+@lru_cache
+def get_conf():
+    from fastapi_mail import ConnectionConfig
+    return ConnectionConfig(
+        MAIL_USERNAME=config.mail_username,
+        MAIL_PASSWORD=config.mail_password,
+        MAIL_FROM=config.mail_from,
+        MAIL_PORT=config.mail_port,
+        MAIL_SERVER=config.mail_server,
+        MAIL_FROM_NAME="Register mail",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+    )
+
+
+# FastMail builds a new jinja Environment for every message, so templates are
+# rendered here with one long-lived environment and sent as a ready html body.
+@lru_cache
+def get_templates():
+    from jinja2 import Environment, FileSystemLoader
+    from src.services.static import static_url
+    templates = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER))
+    templates.globals["static_url"] = static_url
+    return templates
+
+
+def warm_up() -> None:
+    get_conf()
+    templates = get_templates()
+    for name in templates.list_templates():
+        templates.get_template(name)
+
 
 async def send_email(email: EmailStr, username: str, host: str):
-    print(host, username)
+    from fastapi_mail import FastMail, MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
         token_verification = auth_service.create_email_token({"sub": email})
         message = MessageSchema(
             subject="Confirm your email ",
             recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
+            body=get_templates().get_template("email_template.html").render(
+                host=host, username=username, token=token_verification),
             subtype=MessageType.html
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
+        fm = FastMail(get_conf())
+        await fm.send_message(message)
+        logging.info("Confirmation email sent", extra={"username": username})
     except ConnectionErrors as err:
-        print(err)
+        logging.error(f"Sending confirmation email failed: {err}", extra={"username": username})
 
 
 async def send_reset_password_email(email: EmailStr, username: str, host: str, token: str):
+    from fastapi_mail import FastMail, MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
 
     try:
         token_verification = auth_service.create_email_token({"sub": email})
         message = MessageSchema(
             subject="Reset Password ",
             recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
+            body=get_templates().get_template("reset_password.html").render(
+                host=host, username=username, token=token_verification),
             subtype=MessageType.html
         )
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="reset_password.html")
+        fm = FastMail(get_conf())
+        await fm.send_message(message)
+        logging.info("Reset password email sent", extra={"username": username})
     except ConnectionErrors as err:
-        print(err)
\ No newline at end of file
+        logging.error(f"Sending reset password email failed: {err}", extra={"username": username})
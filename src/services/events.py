@@ -0,0 +1,129 @@
+"""
+Contact change events pushed to connected clients.
+
+Routes publish ``{"type": "created" | "updated" | "deleted", "id": ...}`` for the
+owning user. Every worker keeps a single Redis subscription and fans events out to
+a bounded queue per open SSE connection, so an idle connection costs one queue and
+one suspended coroutine. A client that falls behind gets its queue replaced by a
+single ``resync`` event and should catch up through /api/contacts/changes.
+``events_backend = "local"`` keeps everything in process (single worker, local runs).
+broker.close_streams() gives every stream CLOSE, which ends it; server.py calls it
+when the server starts shutting down, so EventSource clients reconnect to another
+worker instead of holding up the shutdown.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+from collections import defaultdict
+
+from src.conf.config import config
+from src.database.db import redis_client
+
+CHANNEL = "contacts:events"
+RESYNC = {"type": "resync"}
+CLOSE = {"type": "close"}  # ends the stream, never sent to the client
+
+
+class LocalBroker:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.closing = False
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, user_id: int | None, event: dict) -> None:
+        if user_id is not None:
+            self.deliver(user_id, event)
+
+    def deliver(self, user_id: int, event: dict) -> None:
+        if self.closing:
+            return
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # never block the publisher on a slow client
+                replace(queue, RESYNC)
+            else:
+                queue.put_nowait(event)
+
+    def close_streams(self) -> None:
+        self.closing = True
+        for queues in self._subscribers.values():
+            for queue in queues:
+                replace(queue, CLOSE)
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        if self.closing:
+            queue.put_nowait(CLOSE)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[user_id]
+
+
+class RedisBroker(LocalBroker):
+    def __init__(self, queue_size: int = 100):
+        super().__init__(queue_size)
+        self._listener: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            listener, self._listener = self._listener, None
+            listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await listener
+
+    async def publish(self, user_id: int | None, event: dict) -> None:
+        if user_id is None:
+            return
+        try:
+            await redis_client.publish(CHANNEL, json.dumps({"user_id": user_id, "event": event}))
+        except Exception as err:
+            logging.error(f"Publishing contact event failed: {err}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with redis_client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        data = json.loads(message["data"])
+                        self.deliver(data["user_id"], data["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logging.error(f"Contact events subscription lost: {err}")
+                await asyncio.sleep(1)
+
+
+def replace(queue: asyncio.Queue, event: dict) -> None:
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+if config.events_backend == "local":
+    broker = LocalBroker(config.events_queue_size)
+else:
+    broker = RedisBroker(config.events_queue_size)
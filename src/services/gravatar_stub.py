@@ -0,0 +1,94 @@
+"""
+Local stand-in for gravatar, for exercising the avatar existence check offline.
+
+    python -m src.services.gravatar_stub --port 8099 --email known@example.com
+
+answers ``HEAD/GET /avatar/<md5>?d=404`` with 200 for the given emails and 404 for
+everything else, like gravatar does. ``GET /hits`` returns how many avatar requests
+it has served, which shows whether the Redis cache in avatar.py is being used.
+Point the app at it with ``GRAVATAR_BASE_URL=http://localhost:8099`` and
+``GRAVATAR_CHECK=true``, or run the check directly:
+
+    python -m src.services.gravatar_stub --email known@example.com --check known@example.com other@example.com
+"""
+import argparse
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+def make_handler(known: set[str]):
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        hits = {"avatar": 0}
+
+        def reply(self, status: int, body: bytes = b"", content_type: str = "image/png"):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+
+        def do_HEAD(self):
+            path = urlsplit(self.path).path
+            if not path.startswith("/avatar/"):
+                self.reply(404)
+                return
+            with lock:
+                self.hits["avatar"] += 1
+            self.reply(200 if path.removeprefix("/avatar/") in known else 404)
+
+        def do_GET(self):
+            if urlsplit(self.path).path == "/hits":
+                with lock:
+                    body = json.dumps(self.hits).encode()
+                self.reply(200, body, "application/json")
+            else:
+                self.do_HEAD()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int, emails: list[str]) -> ThreadingHTTPServer:
+    from src.services.avatar import email_hash
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler({email_hash(email) for email in emails}))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def check(emails: list[str]) -> None:
+    # runs avatar.find_avatar twice per email; the second round should come from Redis
+    from src.services import avatar
+    for attempt in ("first", "cached"):
+        for email in emails:
+            print(f"{attempt:<7} {email}: {await avatar.find_avatar(email)}")
+    await avatar.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake gravatar for the avatar existence check")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--email", action="append", default=[], help="email that has an avatar")
+    parser.add_argument("--check", nargs="+", metavar="EMAIL",
+                        help="resolve these emails through avatar.find_avatar against the stub and exit")
+    args = parser.parse_args()
+
+    if args.check:
+        import os
+        os.environ.update(GRAVATAR_BASE_URL=f"http://127.0.0.1:{args.port}", GRAVATAR_CHECK="true")
+        server = serve(args.port, args.email)
+        asyncio.run(check(args.check))
+        print(f"stub served {server.RequestHandlerClass.hits['avatar']} avatar requests "
+              f"for {2 * len(args.check)} lookups")
+        server.shutdown()
+    else:
+        server = serve(args.port, args.email)
+        print(f"fake gravatar on http://127.0.0.1:{args.port}, known: {', '.join(args.email) or 'none'}")
+        threading.Event().wait()
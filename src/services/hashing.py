@@ -0,0 +1,127 @@
+"""
+Password hashing parameters.
+
+password_context() builds the passlib CryptContext from the config. PASSWORD_SCHEME
+selects bcrypt (BCRYPT_ROUNDS) or argon2id (ARGON2_TIME_COST, ARGON2_MEMORY_COST in
+KiB, ARGON2_PARALLELISM). argon2id needs the optional argon2-cffi package.
+Any hash made with a different scheme or different parameters is reported by
+``needs_update``, and login rehashes it with the current ones. Operators can move
+the cost in either direction without forcing a password reset.
+
+Pick the parameters on the machine that serves logins:
+
+    python -m src.services.hashing --budget-ms 250
+
+The command prints the strongest bcrypt and argon2id settings whose hash time
+stays within the budget.
+"""
+import argparse
+import importlib.util
+import statistics
+import time
+
+from src.conf.config import config
+
+SCHEMES = ("argon2", "bcrypt")
+ARGON2_MEMORY_COSTS = (19456, 47104, 65536, 131072, 262144)
+
+
+def installed(scheme: str) -> bool:
+    return scheme != "argon2" or importlib.util.find_spec("argon2") is not None
+
+
+def password_context(scheme: str | None = None, bcrypt_rounds: int | None = None,
+                     argon2_time_cost: int | None = None, argon2_memory_cost: int | None = None,
+                     argon2_parallelism: int | None = None):
+    from passlib.context import CryptContext
+
+    scheme = scheme or config.password_scheme
+    if scheme not in SCHEMES:
+        raise ValueError(f"Unknown password scheme {scheme!r}, expected one of {SCHEMES}")
+    if not installed(scheme):
+        raise RuntimeError("PASSWORD_SCHEME=argon2 needs the argon2-cffi package")
+    rounds = bcrypt_rounds or config.bcrypt_rounds
+    # the other scheme is kept only to verify (and then replace) hashes made with it
+    settings = {
+        "schemes": [scheme] + [other for other in SCHEMES if other != scheme and installed(other)],
+        "default": scheme,
+        "deprecated": "auto",
+        # min == max, so needs_update flags hashes made with any other cost
+        "bcrypt__rounds": rounds,
+        "bcrypt__min_rounds": rounds,
+        "bcrypt__max_rounds": rounds,
+    }
+    if "argon2" in settings["schemes"]:
+        time_cost = argon2_time_cost or config.argon2_time_cost
+        settings.update({
+            "argon2__type": "ID",
+            "argon2__rounds": time_cost,
+            "argon2__min_rounds": time_cost,
+            "argon2__max_rounds": time_cost,
+            "argon2__memory_cost": argon2_memory_cost or config.argon2_memory_cost,
+            "argon2__parallelism": argon2_parallelism or config.argon2_parallelism,
+        })
+    return CryptContext(**settings)
+
+
+def hash_time(context, samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.hash("correct horse battery staple")
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate_bcrypt(budget_ms: float, samples: int) -> dict | None:
+    best = None
+    for rounds in range(10, 18):
+        elapsed = hash_time(password_context("bcrypt", bcrypt_rounds=rounds), samples)
+        print(f"bcrypt  rounds={rounds:<2}  {elapsed:8.1f} ms")
+        if elapsed > budget_ms:
+            break
+        best = {"PASSWORD_SCHEME": "bcrypt", "BCRYPT_ROUNDS": rounds, "ms": elapsed}
+    return best
+
+
+def calibrate_argon2(budget_ms: float, samples: int, parallelism: int) -> dict | None:
+    best = None
+    for memory_cost in ARGON2_MEMORY_COSTS:
+        for time_cost in range(1, 9):
+            context = password_context("argon2", argon2_time_cost=time_cost, argon2_memory_cost=memory_cost,
+                                       argon2_parallelism=parallelism)
+            elapsed = hash_time(context, samples)
+            print(f"argon2id  m={memory_cost:<6} t={time_cost} p={parallelism}  {elapsed:8.1f} ms")
+            if elapsed > budget_ms:
+                break
+            if best is None or memory_cost * time_cost > best["ARGON2_MEMORY_COST"] * best["ARGON2_TIME_COST"]:
+                best = {"PASSWORD_SCHEME": "argon2", "ARGON2_TIME_COST": time_cost,
+                        "ARGON2_MEMORY_COST": memory_cost, "ARGON2_PARALLELISM": parallelism, "ms": elapsed}
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find password hash parameters for a latency budget")
+    parser.add_argument("--budget-ms", type=float, default=250, help="time one hash may take")
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--parallelism", type=int, default=config.argon2_parallelism)
+    args = parser.parse_args()
+
+    results = [calibrate_bcrypt(args.budget_ms, args.samples)]
+    if installed("argon2"):
+        results.append(calibrate_argon2(args.budget_ms, args.samples, args.parallelism))
+    else:
+        print("argon2-cffi is not installed, skipping argon2id")
+
+    for result in results:
+        if result is None:
+            print("nothing fits the budget")
+            continue
+        elapsed = result.pop("ms")
+        print(f"\n# {elapsed:.1f} ms per login, about {1000 / elapsed:.0f} logins/s per CPU core")
+        for name, value in result.items():
+            print(f"{name}={value}")
+
+
+if __name__ == "__main__":
+    main()
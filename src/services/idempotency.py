@@ -0,0 +1,204 @@
+"""
+``Idempotency-Key`` handling for retried POSTs (signup, contact creation).
+
+The first request with a key runs normally and its response is stored for
+``idempotency_ttl`` seconds. Retries with the same key and the same body get the
+stored response back without reaching the route, the database or bcrypt. A retry
+that arrives while the first request is still running waits for it instead of
+running twice. A key reused with a different body is rejected with 422. 5xx
+responses are not stored, so the client can retry them.
+Keys are scoped by the Authorization header, so two users can't collide. Requests
+without one (signup) share a key space, so there the key is also scoped by the path
+and the body: two clients that both pick "1" get separate entries, and a retry still
+finds its own (a different body is then a new request rather than a 422).
+If the store fails, the request is handled as if it had no key.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+from starlette.responses import JSONResponse
+
+from src.conf.config import config
+from src.database.db import redis_client
+
+HEADER = b"idempotency-key"
+
+
+class LocalStore:
+    """In-process stand-in for Redis, for a single worker and local runs."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float, bytes]] = {}
+
+    def _alive(self, key: str) -> bytes | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del self._data[key]
+            return None
+        return item[1]
+
+    async def get(self, key: str) -> bytes | None:
+        return self._alive(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+
+    async def add(self, key: str, value: bytes, ttl: int) -> bool:
+        if self._alive(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class RedisStore:
+    async def get(self, key: str) -> bytes | None:
+        return await redis_client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await redis_client.set(key, value, ex=ttl)
+
+    async def add(self, key: str, value: bytes, ttl: int) -> bool:
+        return bool(await redis_client.set(key, value, ex=ttl, nx=True))
+
+    async def delete(self, key: str) -> None:
+        await redis_client.delete(key)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, paths=None, store=None, ttl: int | None = None,
+                 lock_timeout: float = 30.0, poll_interval: float = 0.05):
+        self.app = app
+        self.paths = set(paths or config.idempotency_paths)
+        self.store = store or (LocalStore() if config.idempotency_backend == "local" else RedisStore())
+        self.ttl = ttl or config.idempotency_ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(HEADER)
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+
+        body, receive = await self._read_body(receive)
+        fingerprint = hashlib.sha256(scope["path"].encode() + b"\0" + body).hexdigest()
+        authorization = headers.get(b"authorization")
+        if authorization:
+            scope_id = authorization
+        else:
+            scope_id = b"anonymous\0" + fingerprint.encode()
+        key = "idempotency:" + hashlib.sha256(scope_id + b"\0" + idempotency_key).hexdigest()
+
+        lock = f"{key}:lock"
+        locked = False
+        try:
+            stored = await self.store.get(key)
+            if stored is None:
+                locked = await self.store.add(lock, b"1", int(self.lock_timeout))
+                # the first request may have finished between the two calls
+                stored = await self.store.get(key) if locked else await self._wait(key)
+        except Exception as err:
+            logging.error(f"Idempotency store failed, handling the request without it: {err}")
+            if locked:
+                await self._release(lock)
+            return await self.app(scope, receive, send)
+
+        if locked:
+            if stored is None:
+                try:
+                    return await self._run_and_store(key, fingerprint, scope, receive, send)
+                finally:
+                    await self._release(lock)
+            await self._release(lock)
+        elif stored is None:
+            response = JSONResponse({"detail": "A request with this Idempotency-Key is in progress"},
+                                    status_code=409)
+            return await response(scope, receive, send)
+        await self._replay(stored, fingerprint, scope, receive, send)
+
+    async def _release(self, lock: str) -> None:
+        try:
+            await self.store.delete(lock)
+        except Exception as err:
+            # the lock expires after lock_timeout anyway
+            logging.error(f"Releasing idempotency lock failed: {err}")
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+        sent = False
+
+        async def replay_receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return body, replay_receive
+
+    async def _wait(self, key: str) -> bytes | None:
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            stored = await self.store.get(key)
+            if stored is not None:
+                return stored
+            if await self.store.get(f"{key}:lock") is None:
+                return None
+        return None
+
+    async def _replay(self, stored: bytes, fingerprint: str, scope, receive, send):
+        data = json.loads(stored)
+        if data["fingerprint"] != fingerprint:
+            response = JSONResponse({"detail": "Idempotency-Key was already used for a different request"},
+                                    status_code=422)
+            return await response(scope, receive, send)
+        headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in data["headers"]]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": data["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": data["body"].encode("latin-1")})
+
+    async def _run_and_store(self, key: str, fingerprint: str, scope, receive, send):
+        response = {"status": 500, "headers": [], "body": []}
+
+        async def capture(message):
+            await send(message)
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [(name.decode("latin-1"), value.decode("latin-1"))
+                                       for name, value in message.get("headers", [])]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                # stored as soon as the body is complete, not after the background tasks (emails) finish
+                if not message.get("more_body", False) and response["status"] < 500:
+                    try:
+                        await self.store.set(key, json.dumps({
+                            "fingerprint": fingerprint,
+                            "status": response["status"],
+                            "headers": response["headers"],
+                            "body": b"".join(response["body"]).decode("latin-1"),
+                        }).encode(), self.ttl)
+                    except Exception as err:
+                        # the response is already sent; a retry will simply run again
+                        logging.error(f"Storing idempotent response failed: {err}")
+
+        await self.app(scope, receive, capture)
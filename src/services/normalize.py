@@ -0,0 +1,88 @@
+"""
+Normalization of contact fields and the blocking keys used to find duplicates.
+
+Contacts that could be the same person share at least one key: the normalized
+email, the normalized phone or the phonetic name key. The keys are stored in
+indexed columns, so candidates are found by grouping on a key instead of
+comparing every pair of contacts.
+"""
+import re
+
+from src.conf.config import config
+
+_NON_DIGITS = re.compile(r"\D")
+# shortest national number we accept before prepending a country code, so "12345" is not a phone
+MIN_NATIONAL_DIGITS = 7
+
+# Ukrainian/Russian letters, so Cyrillic names get a phonetic key as well
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "h", "ґ": "g", "д": "d", "е": "e", "є": "ye", "ж": "zh",
+    "з": "z", "и": "y", "і": "i", "ї": "yi", "й": "y", "к": "k", "л": "l", "м": "m", "н": "n",
+    "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "shch", "ь": "", "ю": "yu", "я": "ya", "ё": "e", "ы": "y",
+    "э": "e", "ъ": "", "'": "", "’": "",
+}
+
+_SOUNDEX = {letter: digit for digit, letters in {
+    "1": "bfpv", "2": "cgjkqsxz", "3": "dt", "4": "l", "5": "mn", "6": "r"}.items() for letter in letters}
+
+
+def normalize_email(email: str | None) -> str | None:
+    if not email:
+        return None
+    return email.strip().lower() or None
+
+
+def normalize_phone(phone: str | None, country_code: str | None = None) -> str | None:
+    """E.164 form of ``phone`` (``+380671234567``), national numbers get ``country_code``."""
+    if not phone:
+        return None
+    country_code = country_code or config.default_country_code
+    phone = phone.strip()
+    digits = _NON_DIGITS.sub("", phone)
+    if phone.startswith("+"):
+        pass
+    elif digits.startswith("00"):
+        digits = digits[2:]
+    else:
+        if country_code == "380" and digits.startswith("80") and len(digits) == 11:
+            # Ukrainian old long-distance form "8 067 123 45 67"
+            digits = digits[1:]
+        if digits.startswith("0"):
+            national = digits[1:]
+        elif digits.startswith(country_code):
+            national = digits[len(country_code):]
+        else:
+            national = digits
+        if len(national) < MIN_NATIONAL_DIGITS:
+            return None
+        digits = country_code + national
+    if not 8 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+def transliterate(text: str) -> str:
+    return "".join(_TRANSLIT.get(char, char) for char in text.lower())
+
+
+def soundex(word: str) -> str:
+    letters = [char for char in transliterate(word) if "a" <= char <= "z"]
+    if not letters:
+        return ""
+    code = letters[0].upper()
+    last = _SOUNDEX.get(letters[0], "")
+    for char in letters[1:]:
+        digit = _SOUNDEX.get(char, "")
+        if digit and digit != last:
+            code += digit
+        if char not in "hw":
+            last = digit
+    return (code + "000")[:4]
+
+
+def name_key(first_name: str | None, last_name: str | None) -> str | None:
+    # sorted, so "Ivan Lubyk" and "lubyk IVAN" share a key
+    words = f"{first_name or ''} {last_name or ''}".split()
+    codes = sorted(code for code in (soundex(word) for word in words) if code)
+    return " ".join(codes) or None
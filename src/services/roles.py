@@ -1,13 +1,14 @@
 from typing import List
 from fastapi import Request, Depends, HTTPException, status
-from src.database.models import Role, User
-from src.services.auth import auth_service
+from src.database.models import Role
+from src.services.auth import auth_service, Principal
 
 
 class RoseAccess:
     def __init__(self, allowed_roles: List[Role]):
         self.allowed_roles = allowed_roles
 
-    async def __call__(self, request: Request, user: User = Depends(auth_service.get_current_user)):
-        if user.role not in self.allowed_roles:
+    async def __call__(self, request: Request, principal: Principal = Depends(auth_service.get_principal)):
+        # role comes from the signed token, so the check itself never touches the database
+        if principal.role not in self.allowed_roles:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operation forbidden")
@@ -0,0 +1,39 @@
+"""
+Single-flight for identical concurrent reads.
+
+Callers asking for the same key while a call is in flight await that call's
+result instead of issuing their own query. The shared call runs as its own task,
+so one caller disconnecting does not cancel it for the others. For the same
+reason ``fn`` must not use anything owned by one caller, such as its request's
+database session. Results are shared as-is and must be treated as read-only.
+"""
+import asyncio
+
+groups: dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        self._tasks: dict[tuple, asyncio.Task] = {}
+        groups[name] = self
+
+    async def do(self, key: tuple, fn):
+        self.calls += 1
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key) if self._tasks.get(key) is done else None)
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "deduplicated": self.shared, "in_flight": len(self._tasks)}
+
+
+def stats() -> dict:
+    return {name: group.stats() for name, group in groups.items()}
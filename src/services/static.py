@@ -0,0 +1,102 @@
+"""
+Static files with long-lived caching.
+
+Every file under src/static is also served as ``name.<content hash>.ext``. Those
+URLs never change content, so they are sent with ``immutable`` and a one-year
+max-age; plain names get ``static_max_age``. Use static_url() to link to them. If
+a ``.br`` or ``.gz`` sibling exists and the client accepts it, the precompressed
+file is sent as is. Run ``python -m src.services.static`` to generate those.
+With ``static_cdn_url`` set, static_url() points at the CDN, which can cache the
+hashed URLs forever; serving the bytes (sendfile) is then left to the CDN or the
+reverse proxy in front of the app.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles
+
+from src.conf.config import config
+from src.services.compression import negotiate
+
+STATIC_DIR = Path(__file__).parent.parent / "static"
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE = {".css", ".js", ".html", ".svg", ".json", ".txt", ".xml"}
+
+# 1x1 transparent GIF, returned inline by the email open tracking route
+PIXEL = bytes.fromhex("47494638396101000100800000000000ffffff21f90401000000002c00000000010001000002024401003b")
+
+
+@lru_cache
+def manifest(directory: Path = STATIC_DIR) -> dict[str, str]:
+    """Original relative path -> content-hashed relative path."""
+    hashed = {}
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix in (".br", ".gz"):
+            continue
+        name = path.relative_to(directory).as_posix()
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:10]
+        stem, dot, suffix = name.rpartition(".")
+        hashed[name] = f"{stem}.{digest}.{suffix}" if dot else f"{name}.{digest}"
+    return hashed
+
+
+def static_url(name: str, host: str = "") -> str:
+    hashed = manifest().get(name, name)
+    if config.static_cdn_url:
+        return f"{config.static_cdn_url.rstrip('/')}/{hashed}"
+    return f"{host.rstrip('/')}/static/{hashed}"
+
+
+class CachedStaticFiles(StaticFiles):
+    def __init__(self, *args, directory: Path = STATIC_DIR, **kwargs):
+        super().__init__(*args, directory=directory, **kwargs)
+        self.originals = {hashed: name for name, hashed in manifest(Path(directory)).items()}
+
+    async def get_response(self, path: str, scope):
+        original = self.originals.get(path)
+        response = await super().get_response(original or path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE if original else f"public, max-age={config.static_max_age}"
+        return response
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        variants = {encoding: f"{full_path}{suffix}" for encoding, suffix in ENCODINGS}
+        variants = {encoding: path for encoding, path in variants.items() if os.path.isfile(path)}
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), variants)
+        if encoding is not None:
+            path = variants[encoding]
+            response = super().file_response(path, os.stat(path), scope, status_code)
+            if response.status_code == 200:
+                response.headers["Content-Encoding"] = encoding
+                response.headers["Content-Type"] = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+def precompress(directory: Path = STATIC_DIR) -> None:
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    for path in directory.rglob("*"):
+        if not path.is_file() or path.suffix not in COMPRESSIBLE:
+            continue
+        data = path.read_bytes()
+        Path(f"{path}.gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            Path(f"{path}.br").write_bytes(brotli.compress(data, quality=11))
+        print(f"compressed {path.relative_to(directory)}")
+
+
+if __name__ == "__main__":
+    precompress()
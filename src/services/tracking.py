@@ -0,0 +1,100 @@
+"""
+Email open tracking.
+
+record() only appends to an in-memory ring buffer, so a tracking hit costs
+microseconds. A background task started in the app lifespan flushes the buffer to
+Postgres every ``tracking_flush_interval`` seconds, or sooner once
+``tracking_batch_size`` events are waiting. Each batch is one multi-row INSERT plus
+one counter upsert. When the buffer is full the oldest events are dropped and
+counted in ``dropped``. A batch that fails to save goes back to the front of the
+buffer. Retries then back off, from ``tracking_flush_interval`` doubling up to
+MAX_RETRY_DELAY, and a full buffer doesn't cut the wait short, so an outage logs
+one error per attempt instead of a retry on every hit.
+"""
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+
+from src.conf.config import config
+from src.database.db import sessionmanager
+from src.repository import email_opens as repository_opens
+
+MAX_USERNAME = 50  # email_opens.username is String(50); a longer one would fail the whole batch
+MAX_RETRY_DELAY = 300.0
+
+
+class OpenTracker:
+    def __init__(self, capacity: int, batch_size: int, interval: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._buffer: deque = deque(maxlen=capacity)
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._retry_delay = 0.0  # non-zero while saving fails
+        self._task: asyncio.Task | None = None
+
+    def record(self, username: str) -> None:
+        if len(username) > MAX_USERNAME:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((username, datetime.utcnow()))
+        if len(self._buffer) >= self.batch_size and not self._retry_delay:
+            self._wake.set()
+
+    async def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # the loop does the final flush itself, so a batch it is writing right now isn't cut off
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        else:
+            await self.flush()
+        if self._buffer:
+            logging.error(f"{len(self._buffer)} email opens were not saved before shutdown")
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self._retry_delay or self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if await self.flush():
+                self._retry_delay = 0.0
+            else:
+                self._retry_delay = min(max(self._retry_delay * 2, self.interval), MAX_RETRY_DELAY)
+                # a wake from record() during the failed flush would retry at once
+                self._wake.clear()
+
+    async def flush(self) -> bool:
+        """Saves the buffer batch by batch; False if a batch failed and was put back."""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            try:
+                async with sessionmanager.session() as db:
+                    await repository_opens.save_opens(batch, db)
+                    await db.commit()
+            except Exception as err:
+                logging.error(f"Saving {len(batch)} email opens failed: {err}")
+                self._requeue(batch)
+                return False
+        return True
+
+    def _requeue(self, batch: list) -> None:
+        # back in front of newer events; if those filled the buffer meanwhile, the oldest go
+        overflow = len(batch) + len(self._buffer) - self._buffer.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+            batch = batch[overflow:]
+        self._buffer.extendleft(reversed(batch))
+
+
+tracker = OpenTracker(config.tracking_buffer_size, config.tracking_batch_size, config.tracking_flush_interval)